@@ -4,12 +4,14 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from crewai import Agent
-from crewai import LLM
 
-from tools import search_tool, FinancialDocumentTool
+from llm_cache import CachedLLM
+from tools import search_tool, DocumentSearchTool
 
-### Loading LLM
-llm = LLM(
+### Loading LLM (responses are cached on disk; see LLM_CACHE_MODE)
+# Requests from every agent share one quota-aware scheduler (see ratelimit.py),
+# so the agents no longer set max_rpm individually
+llm = CachedLLM(
     provider="openai",
     model="command-a-03-2025",
     api_key=os.getenv("COHERE_API_KEY"),
@@ -35,10 +37,9 @@ financial_analyst = Agent(
         "predictions without solid supporting evidence. All recommendations include appropriate "
         "risk disclosures and consider the client's investment profile."
     ),
-    tools=[FinancialDocumentTool()],
+    tools=[DocumentSearchTool()],
     llm=llm,
     max_iter=15,  # Allow multiple iterations for thorough document analysis
-    max_rpm=5,    # Rate limit to prevent API throttling
     allow_delegation=True  # Allow delegation to other specialists
 )
 
@@ -61,7 +62,6 @@ verifier = Agent(
     ),
     llm=llm,
     max_iter=10,  # Allow sufficient iterations for thorough verification
-    max_rpm=5,
     allow_delegation=True
 )
 
@@ -87,7 +87,6 @@ investment_advisor = Agent(
     ),
     llm=llm,
     max_iter=15,  # Allow detailed investment planning
-    max_rpm=5,
     allow_delegation=False
 )
 
@@ -113,6 +112,5 @@ risk_assessor = Agent(
     ),
     llm=llm,
     max_iter=12,  # Allow comprehensive risk modeling
-    max_rpm=5,
     allow_delegation=False
 )
\ No newline at end of file
@@ -0,0 +1,247 @@
+## Importing libraries and files
+import argparse
+import contextlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction import extract_documents
+from ingest import resolve_document
+from jobs import COMPLETED, FAILED, JobInProgressError, JobQueue, JobStore
+from metrics import Trace, activate_trace, stage
+from ratelimit import BATCH, priority
+from results import ResultStore, normalize_query, task_outputs
+from retrieval import build_index
+from verification import crew_verification_status
+
+## Batch configuration (overridable through environment variables)
+# Crews analyzed at the same time; their LLM calls share the process-wide rate limiter
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Server-side directories given to /analyze/batch must lie under this root
+BATCH_ROOT = os.getenv("BATCH_ROOT", "data")
+# How often a document waiting on another worker's identical analysis checks on it
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "1"))
+
+DEFAULT_QUERY = "Provide a comprehensive financial analysis and investment recommendation"
+
+
+def discover_documents(paths: list) -> list:
+    """Expand files and directories into the PDF paths they contain
+
+    Args:
+        paths: PDF files and/or directories (searched recursively)
+
+    Returns:
+        list[str]: PDF paths, directory contents in sorted order
+    """
+    documents = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in sorted(os.walk(path)):
+                documents.extend(
+                    os.path.join(directory, filename)
+                    for filename in sorted(filenames) if filename.lower().endswith(".pdf")
+                )
+        else:
+            documents.append(path)
+    return documents
+
+
+def _claim_job(jobs: JobQueue, store: ResultStore, digest: str, name: str, query: str) -> tuple:
+    """Claim the job key of a document and query, waiting out an identical analysis in progress
+
+    Returns:
+        tuple: (job id, None) once claimed, or (None, stored analysis) when the job
+            that held the key saved an analysis this document can use
+    """
+    key = f"{digest}:{normalize_query(query)}"
+    metadata = {"query": query, "file_processed": name, "document_sha256": digest, "batch": True}
+    while True:
+        try:
+            return jobs.claim(metadata, key), None
+        except JobInProgressError as e:
+            print(f"Waiting for job {e.job_id} already analyzing {name}")
+            jobs.store.wait(e.job_id, BATCH_POLL_SECONDS)
+        stored = store.lookup(digest, query) if store is not None else None
+        if stored is not None:
+            return None, stored
+
+
+def analyze_batch(documents: list, query: str, run, concurrency: int = BATCH_CONCURRENCY, workers: int = None,
+                  store: ResultStore = None, refresh: bool = False, jobs: JobQueue = None):
+    """Analyze many documents, extracting them in parallel and running crews concurrently
+
+    All documents go to the extraction process pool at once; each crew starts as
+    soon as its document is indexed, with at most `concurrency` crews in flight.
+    LLM requests from every crew share the process-wide rate limiter, so throughput
+    is bounded by cores and API quota rather than by the number of documents.
+
+    Args:
+        documents: (name, document) pairs, document being a path or registered reference
+        query: Analysis question asked of every document
+        run: Callable(query, document) running one crew, e.g. main.run_crew
+        concurrency: Crews running at the same time
+        workers: Extraction worker processes (defaults to EXTRACTION_WORKERS)
+        store: Result store; documents it already holds for the query are answered
+            from it without extraction, and new analyses are saved to it
+        refresh: Analyze every document again even if the store holds a result
+        jobs: Job queue whose store records each crew under its document-and-query key,
+            so no other batch or request (in any worker) analyzes the same document
+            and query at the same time; the queue's drain() waits for the crews
+
+    Yields:
+        dict: One "result" record per document in completion order, then a "summary"
+    """
+    started = time.perf_counter()
+    results = queue.Queue()
+    resolved = []
+    for position, (name, document) in enumerate(documents):
+        try:
+            source, digest = resolve_document(document)
+        except OSError as e:
+            resolved.append(None)
+            results.put(_result(position, name, None, "failed", started, error=str(e)))
+            continue
+        stored = store.lookup(digest, query) if store is not None and not refresh else None
+        if stored is not None:
+            resolved.append(None)
+            results.put(_result(position, name, digest, "completed", started, cached=True,
+                                analysis_id=stored["id"], analysis=stored["analysis"]))
+            continue
+        resolved.append((source, digest))
+
+    def analyze(position: int, pages: list):
+        name, document = documents[position]
+        digest = resolved[position][1]
+        trace = Trace()
+        activate_trace(trace)
+        document_started = time.perf_counter()
+        job_id = None
+        try:
+            job_id, stored = _claim_job(jobs, store, digest, name, query) if jobs is not None else (None, None)
+            if stored is not None:
+                record = _result(position, name, digest, "completed", document_started, cached=True,
+                                 analysis_id=stored["id"], analysis=stored["analysis"])
+            else:
+                build_index(document, pages=pages)
+                # Interactive analyses get ahead of batch documents when the LLM quota is short
+                with priority(BATCH), stage("crew"):
+                    response = run(query, document)
+                fields = {"analysis": str(response), "verification_status": crew_verification_status(response)}
+                if store is not None:
+                    fields["analysis_id"] = store.save(digest, query, name, str(response), task_outputs(response))
+                if job_id is not None:
+                    summary = {key: fields.get(key) for key in ("analysis_id", "verification_status")}
+                    jobs.release(job_id, COMPLETED, progress=1.0,
+                                 result=json.dumps({**summary, "trace_id": trace.trace_id}))
+                    job_id = None
+                record = _result(position, name, digest, "completed", document_started, **fields)
+        except Exception as e:
+            if job_id is not None:
+                jobs.release(job_id, FAILED, error=str(e))
+            record = _result(position, name, digest, "failed", document_started, error=str(e))
+        finally:
+            trace.save()
+        record["trace_id"] = trace.trace_id
+        results.put(record)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch-crew")
+    abandoned = threading.Event()
+
+    def feed():
+        # Schedule each crew as soon as its document comes out of the extraction pool
+        positions = [position for position, entry in enumerate(resolved) if entry is not None]
+        reported = set()
+        try:
+            extracted = extract_documents([resolved[position][0] for position in positions], workers)
+            for offset, pages in extracted:
+                position = positions[offset]
+                if isinstance(pages, Exception):
+                    name, _ = documents[position]
+                    results.put(_result(position, name, resolved[position][1], "failed", started,
+                                        error=f"Extraction failed: {pages}"))
+                else:
+                    executor.submit(analyze, position, pages)
+                reported.add(position)
+        except Exception as e:
+            if abandoned.is_set():
+                # The consumer went away and shut the executor down underneath us
+                return
+            # Every document must get a record, or the consumer waits for it forever
+            for position in positions:
+                if position not in reported:
+                    name, _ = documents[position]
+                    results.put(_result(position, name, resolved[position][1], "failed", started,
+                                        error=f"Extraction failed: {e}"))
+
+    feeder = threading.Thread(target=feed, name="batch-extraction", daemon=True)
+    feeder.start()
+    counts = {"completed": 0, "failed": 0}
+    try:
+        for _ in documents:
+            record = results.get()
+            counts[record["status"]] += 1
+            yield record
+        yield {
+            "event": "summary",
+            "documents": len(documents),
+            **counts,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+    finally:
+        abandoned.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _result(position: int, name: str, sha256: str, status: str, started: float, **fields) -> dict:
+    return {
+        "event": "result",
+        "index": position,
+        "document": name,
+        "sha256": sha256,
+        "status": status,
+        "seconds": round(time.perf_counter() - started, 3),
+        **fields
+    }
+
+
+def main(argv: list = None):
+    """Command-line entry point: analyze PDFs and directories, writing NDJSON records"""
+    parser = argparse.ArgumentParser(description="Analyze many financial documents in one run")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories of PDFs")
+    parser.add_argument("--query", default=DEFAULT_QUERY, help="Analysis question asked of every document")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Crews running at the same time")
+    parser.add_argument("--workers", type=int, default=None, help="PDF extraction worker processes")
+    parser.add_argument("--output", default="-", help="NDJSON output file ('-' for stdout)")
+    parser.add_argument("--refresh", action="store_true", help="Re-analyze documents that have stored results")
+    args = parser.parse_args(argv)
+
+    # Deferred so the API can import this module without a circular import
+    from main import run_crew
+
+    paths = discover_documents(args.paths)
+    if not paths:
+        parser.error("no PDF documents found")
+    documents = [(path, path) for path in paths]
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        # Verbose crew logging goes to stderr so stdout carries nothing but NDJSON
+        with contextlib.redirect_stdout(sys.stderr):
+            records = analyze_batch(
+                documents, args.query, run_crew, args.concurrency, args.workers,
+                store=ResultStore(), refresh=args.refresh, jobs=JobQueue(JobStore())
+            )
+            for record in records:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+## Importing libraries and files
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+# Benchmarks run against throwaway stores and never reach a provider; these are
+# set before any application module reads its configuration
+BENCH_ENVIRONMENT = {
+    "LLM_CACHE_MODE": "off",
+    "LLM_RPM": "0",
+    "LLM_TPM": "0",
+    "OTEL_SDK_DISABLED": "true",
+    "CREW_PREWARM": "false",
+    "OCR_ENABLED": "false",
+    "SEARCH_BACKEND": "serper",
+    "JOB_QUEUE_LIMIT": "100000",
+}
+STORE_PATHS = {
+    "CACHE_DIR": "cache",
+    "RESULTS_DB_PATH": "results.sqlite",
+    "JOBS_DB_PATH": "jobs.sqlite",
+    "TRACE_DIR": "traces",
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+## Synthetic documents
+_STATEMENT_PAGES = [
+    ("Consolidated Statements of Operations", [
+        "Total revenues", "Cost of revenues", "Gross profit", "Operating income",
+        "Depreciation and amortization", "Interest expense", "Net income", "Diluted earnings per share",
+    ]),
+    ("Consolidated Balance Sheets", [
+        "Total current assets", "Inventories", "Total assets", "Total current liabilities",
+        "Long-term debt", "Total liabilities", "Total stockholders' equity",
+        "Total liabilities and stockholders' equity",
+    ]),
+    ("Consolidated Statements of Cash Flows", [
+        "Net cash provided by operating activities", "Purchases of property and equipment",
+    ]),
+]
+_NARRATIVE = [
+    "Revenue increased {pct}% year over year to ${amount} million, driven by volume growth in all segments.",
+    "Operating margin was {pct}% compared with {pct2}% in the prior year as cost programs took effect.",
+    "We returned ${amount} million to shareholders through dividends and share repurchases.",
+    "Free cash flow of ${amount} million funded capital expenditures and debt reduction.",
+    "Management expects demand to remain stable, with pricing pressure in {segment} markets.",
+    "The segment reported ${amount} million of revenue and ${amount2} million of operating income.",
+]
+_RISKS = [
+    "Risk factors: changes in interest rates could increase our cost of borrowing.",
+    "We are party to litigation arising in the ordinary course of business.",
+    "A material weakness in internal control could affect the reliability of our reporting.",
+    "Our credit agreement contains covenants that restrict additional indebtedness.",
+]
+LINES_PER_PAGE = 40
+
+
+def _page_lines(page_number: int, rng: random.Random) -> list:
+    if page_number <= len(_STATEMENT_PAGES):
+        title, items = _STATEMENT_PAGES[page_number - 1]
+        lines = [f"ACME Corp Form 10-K - {title}", "(in millions) 2024 2023"]
+        for item in items:
+            lines.append(f"{item} {rng.randint(100, 9000):,} {rng.randint(100, 9000):,}")
+        return lines
+    lines = [f"ACME Corp Form 10-K - page {page_number}"]
+    source = _RISKS if page_number % 10 == 0 else _NARRATIVE
+    while len(lines) < LINES_PER_PAGE:
+        lines.append(rng.choice(source).format(
+            pct=rng.randint(1, 40), pct2=rng.randint(1, 40), amount=f"{rng.randint(10, 5000):,}",
+            amount2=f"{rng.randint(10, 900):,}", segment=rng.choice(["industrial", "consumer", "energy"]),
+        ))
+    return lines
+
+
+def _pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def synthetic_pdf(page_count: int, seed: int = 0) -> bytes:
+    """A text-only financial filing of page_count pages, written without any PDF library
+
+    The first pages hold the three primary statements; the rest are MD&A-style
+    narrative full of figures, with a risk-factor page every tenth page. The same
+    seed always produces the same bytes.
+    """
+    rng = random.Random(seed)
+    # Objects 1-3 are the catalog, the page tree and the font; each page adds a page and a content stream
+    objects = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page_number in range(1, page_count + 1):
+        lines = _page_lines(page_number, rng)
+        content = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({_pdf_text(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode("latin-1"))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>".encode()
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+## Fakes
+class FakeLLM:
+    """Deterministic stand-in for the provider call behind CachedLLM
+
+    Like a well-behaved agent, it calls each tool it was given once (one request
+    per step), then gives a final answer of answer_chars characters. Caching,
+    rate limiting and instrumentation around the provider call still run.
+    """
+
+    def __init__(self, latency: float = 0.0, answer_chars: int = 2000):
+        self.latency = latency
+        self.answer_chars = answer_chars
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _action(self, tool: str, document: str) -> str:
+        if tool == "Financial Document Search":
+            arguments = {"query": "total revenue net income total assets", "path": document, "top_k": 5}
+        elif tool == "Search the internet with Serper":
+            arguments = {"search_query": "ACME Corp industry outlook"}
+        elif tool == "Investment Analysis Tool":
+            arguments = {"path": document, "share_price": 25.0}
+        else:
+            arguments = {"path": document}
+        return f"Thought: I should use {tool}.\nAction: {tool}\nAction Input: {json.dumps(arguments)}"
+
+    def __call__(self, llm, messages, tools=None, callbacks=None, available_functions=None):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        text = "\n".join(str(message.get("content") or "") for message in messages)
+        tools = list(dict.fromkeys(re.findall(r"^Tool Name: (.+)$", text, re.MULTILINE)))
+        document = re.search(r'path\s+"([^"]+)"', text)
+        step = sum(1 for message in messages if message.get("role") == "assistant")
+        if document and step < len(tools):
+            return self._action(tools[step], document.group(1))
+        filler = ("Revenue grew and margins held steady across segments. " * (self.answer_chars // 55 + 1))
+        return (
+            "Thought: I now know the final answer.\nFinal Answer: "
+            f"{filler[:self.answer_chars]}\n5. **Verification Status**: APPROVED - synthetic filing"
+        )
+
+
+def fake_search(latency: float):
+    """Replacement for SerperBackend.search returning canned results after latency seconds
+
+    Only the network call is faked: query normalization, the result cache and
+    coalescing still run.
+    """
+    def search(self, query: str) -> str:
+        if latency:
+            time.sleep(latency)
+        return (
+            f"Search results for {query!r}:\n"
+            "1. Industry outlook remains stable - analysts expect low single-digit growth.\n"
+            "2. Peers trade at 15-18x forward earnings."
+        )
+    return search
+
+
+def install_fakes(llm_latency: float, search_latency: float, answer_chars: int) -> FakeLLM:
+    """Patch the provider call and the web search; returns the fake LLM (for its call count)
+
+    Calling it again only changes the latencies.
+    """
+    from crewai import LLM
+
+    from web_search import SerperBackend
+
+    fake = getattr(LLM.call, "fake", None)
+    if fake is None:
+        fake = FakeLLM(llm_latency, answer_chars)
+        LLM.call = lambda self, *args, **kwargs: fake(self, *args, **kwargs)
+        LLM.call.fake = fake
+    fake.latency = llm_latency
+    SerperBackend.search = fake_search(search_latency)
+    return fake
+
+
+## Measurements
+def _percentiles(values: list) -> dict:
+    ordered = sorted(values)
+    result = {}
+    for percentile in PERCENTILES:
+        index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+        result[f"p{percentile}_seconds"] = round(ordered[index], 4)
+    result["max_seconds"] = round(ordered[-1], 4)
+    result["mean_seconds"] = round(statistics.fmean(ordered), 4)
+    return result
+
+
+def memory() -> dict:
+    """Peak resident set size of this process and of its finished children (pool workers)"""
+    from metrics import max_rss_bytes
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "max_rss_bytes": max_rss_bytes(),
+        "children_max_rss_bytes": children if sys.platform == "darwin" else children * 1024,
+    }
+
+
+def bench_extraction(page_counts: list, repeat: int, workdir: str) -> dict:
+    """Pages and bytes per second of extract_pages, serial and across the process pool"""
+    from extraction import EXTRACTION_WORKERS, extract_pages
+
+    results = {}
+    for page_count in page_counts:
+        data = synthetic_pdf(page_count, seed=page_count)
+        path = os.path.join(workdir, f"synthetic_{page_count}.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        results[str(page_count)] = {"bytes": len(data)}
+        for mode, workers in (("serial", 1), ("parallel", EXTRACTION_WORKERS)):
+            extract_pages(path, workers)  # warm-up (and pool start-up)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                pages = extract_pages(path, workers)
+                timings.append(time.perf_counter() - started)
+            assert len(pages) == page_count
+            seconds = statistics.median(timings)
+            results[str(page_count)][mode] = {
+                "workers": workers,
+                "seconds": round(seconds, 4),
+                "pages_per_second": round(page_count / seconds, 1),
+                "megabytes_per_second": round(len(data) / seconds / 1e6, 2),
+            }
+        print(f"extraction {page_count:>5} pages: serial {results[str(page_count)]['serial']['seconds']}s, "
+              f"parallel {results[str(page_count)]['parallel']['seconds']}s", file=sys.stderr)
+    return results
+
+
+def bench_tasks(runs: int, workdir: str, fake: FakeLLM) -> dict:
+    """Per-task time spent outside the (instant) fake LLM and search: the pipeline's own overhead"""
+    from main import crew_template, run_crew
+    from metrics import start_trace
+    from retrieval import build_index
+
+    path = os.path.join(workdir, "synthetic_tasks.pdf")
+    with open(path, "wb") as f:
+        f.write(synthetic_pdf(10, seed=10))
+    build_index(path)
+    crew_template().fill(1)
+
+    results = {}
+    for mode in ("dag", "sequential"):
+        per_task, totals, calls = {}, [], []
+        for run in range(runs + 1):
+            trace = start_trace()
+            calls_before = fake.calls
+            started = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                run_crew(f"benchmark run {run}", path, execution_mode=mode)
+            if run == 0:
+                continue  # warm-up
+            totals.append(time.perf_counter() - started)
+            calls.append(fake.calls - calls_before)
+            for span in trace.spans:
+                if span["stage"] == "crew_task":
+                    per_task.setdefault(span["task"], []).append(span["duration_seconds"])
+        results[mode] = {
+            "crew_seconds": round(statistics.median(totals), 4),
+            "llm_calls_per_run": statistics.median(calls),
+            "task_seconds": {task: round(statistics.median(durations), 4) for task, durations in per_task.items()},
+        }
+        print(f"tasks {mode}: {results[mode]['crew_seconds']}s per crew run", file=sys.stderr)
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_e2e(client_counts: list, requests_per_client: int, page_count: int, workdir: str) -> dict:
+    """Latency from upload to finished job under N concurrent /analyze clients"""
+    import httpx
+    import uvicorn
+
+    from main import app, crew_template
+    from jobs import JOB_WORKERS
+
+    crew_template().fill(JOB_WORKERS)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-server", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    document = synthetic_pdf(page_count, seed=page_count)
+    base_url = f"http://127.0.0.1:{port}"
+    results = {}
+    try:
+        for clients in client_counts:
+            latencies, errors = [], []
+
+            def client():
+                with httpx.Client(base_url=base_url, timeout=600) as http:
+                    for request in range(requests_per_client):
+                        started = time.perf_counter()
+                        response = http.post(
+                            "/analyze",
+                            files={"file": ("synthetic.pdf", document, "application/pdf")},
+                            # A fresh query per request, so no stored analysis is reused
+                            data={"query": f"benchmark {uuid.uuid4()}", "refresh": "true"},
+                        )
+                        if response.status_code != 202:
+                            errors.append(f"{response.status_code}: {response.text[:200]}")
+                            continue
+                        status_url = response.json()["status_url"]
+                        while True:
+                            job = http.get(status_url).json()
+                            if job["status"] in ("completed", "failed"):
+                                break
+                            time.sleep(0.02)
+                        if job["status"] == "failed":
+                            errors.append(job.get("error") or "failed")
+                            continue
+                        latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            for client_thread in threads:
+                client_thread.start()
+            for client_thread in threads:
+                client_thread.join()
+            wall = time.perf_counter() - started
+            results[str(clients)] = {
+                "requests": clients * requests_per_client,
+                "errors": len(errors),
+                "first_error": errors[0] if errors else None,
+                "requests_per_second": round(len(latencies) / wall, 3),
+                **(_percentiles(latencies) if latencies else {}),
+            }
+            print(f"e2e {clients:>3} clients: p50 {results[str(clients)].get('p50_seconds')}s, "
+                  f"p95 {results[str(clients)].get('p95_seconds')}s, {len(errors)} errors", file=sys.stderr)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return results
+
+
+## Comparison
+def _flatten(value, prefix: str = "") -> dict:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """Metrics that got worse than baseline by more than tolerance (a fraction)
+
+    Throughputs (per_second) should not drop; times and memory should not grow.
+    """
+    regressions = []
+    old, new = _flatten(baseline), _flatten(current)
+    for key in sorted(old.keys() & new.keys()):
+        measured = any(part.endswith(("seconds", "per_second", "_rss_bytes")) for part in key.split("."))
+        if key.startswith("meta.") or not old[key] or not measured:
+            continue
+        change = (new[key] - old[key]) / abs(old[key])
+        worse = -change if key.endswith("per_second") else change
+        if worse > tolerance:
+            regressions.append({"metric": key, "baseline": old[key], "current": new[key], "change": round(change, 3)})
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _integers(text: str) -> list:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def main(argv: list = None):
+    """Run the benchmark suite against a fake LLM and fake web search
+
+    Example:
+        python bench.py --pages 10,100,1000 --clients 1,4,16 --output bench.json
+        python bench.py --compare bench.json
+    """
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks with a stubbed LLM and web search")
+    parser.add_argument("--pages", default="10,100,1000", help="Synthetic document sizes for extraction")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per extraction size")
+    parser.add_argument("--task-runs", type=int, default=5, help="Crew runs for the per-task overhead")
+    parser.add_argument("--clients", default="1,4,16", help="Concurrent /analyze clients to sample")
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--e2e-pages", type=int, default=20, help="Pages of the document the clients upload")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call in the e2e run")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per fake web search in the e2e run")
+    parser.add_argument("--answer-chars", type=int, default=2000, help="Length of each fake final answer")
+    parser.add_argument("--skip", default="", help="Comma-separated phases to skip: extraction, tasks, e2e")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Baseline report; exit 1 if any metric regressed beyond --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    skip = {phase.strip() for phase in args.skip.split(",") if phase.strip()}
+
+    workdir = tempfile.mkdtemp(prefix="fda-bench-")
+    for name, value in BENCH_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    for name, relative in STORE_PATHS.items():
+        os.environ[name] = os.path.join(workdir, relative)
+    client_counts = _integers(args.clients)
+    # Enough job workers that every client's request can run at once
+    os.environ.setdefault("JOB_WORKERS", str(max(client_counts, default=1)))
+
+    report = {
+        "meta": {
+            "started": time.time(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "arguments": vars(args),
+        }
+    }
+    # Crew output goes to stderr, so stdout only carries the report
+    with contextlib.redirect_stdout(sys.stderr):
+        if "extraction" not in skip:
+            report["extraction"] = bench_extraction(_integers(args.pages), args.repeat, workdir)
+            report["memory_after_extraction"] = memory()
+        # The fake LLM and search answer instantly here, so task time is pipeline overhead
+        fake = install_fakes(0.0, 0.0, args.answer_chars)
+        if "tasks" not in skip:
+            report["tasks"] = bench_tasks(args.task_runs, workdir, fake)
+            report["memory_after_tasks"] = memory()
+        if "e2e" not in skip:
+            install_fakes(args.llm_latency, args.search_latency, args.answer_chars)
+            report["e2e"] = bench_e2e(client_counts, args.requests, args.e2e_pages, workdir)
+            report["memory_after_e2e"] = memory()
+    report["meta"]["job_workers"] = int(os.environ["JOB_WORKERS"])
+    report["meta"]["seconds"] = round(time.time() - report["meta"]["started"], 1)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+                  f"({regression['change']:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+## Importing libraries and files
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+## Cache configuration (overridable through environment variables)
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+DOC_CACHE_MEMORY_BYTES = int(os.getenv("DOC_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+DOC_CACHE_DISK_BYTES = int(os.getenv("DOC_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+# Seconds a writer waits for another thread or worker process to release a SQLite database
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: str) -> str:
+    """Compute the SHA-256 hex digest of a file without loading it into memory
+
+    Args:
+        path: Path of the file to hash
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite database shared by several threads and worker processes
+
+    WAL lets readers proceed while another process writes, and the busy timeout
+    makes concurrent writers wait their turn instead of failing with "database is
+    locked". Every store (caches, results, jobs) opens its connections here.
+    """
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Durable at checkpoints rather than on every commit, which WAL makes safe
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteConnections:
+    """Callable returning this thread's connect_sqlite() connection to one database
+
+    sqlite3 connections must not be shared across threads, so each thread opens
+    its own on first use and keeps it.
+    """
+
+    def __init__(self, path: str, row_factory=None):
+        self.path = path
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.path)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            self._local.conn = conn
+        return conn
+
+
+## In-memory tier
+class LRUCache:
+    """Thread-safe in-memory LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key: str, value, size: int):
+        # Values larger than the whole budget would just flush everything else
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+## On-disk tier
+class DiskCache:
+    """SQLite-backed key/value store bounded by the total size of its values
+
+    Least recently accessed entries are evicted first once ``max_bytes`` is exceeded.
+    With a ``ttl`` (seconds), entries older than that are treated as misses and removed.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connect = SQLiteConnections(path)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key: str):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        with conn:
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, value: bytes):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        entries, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        with self._lock:
+            return {
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+## Parsed-document cache
+class DocumentCache:
+    """Two-tier cache of extracted document text keyed by the SHA-256 of the file bytes"""
+
+    def __init__(self, memory_bytes: int = DOC_CACHE_MEMORY_BYTES,
+                 disk_bytes: int = DOC_CACHE_DISK_BYTES,
+                 directory: str = CACHE_DIR):
+        self.memory = LRUCache(memory_bytes)
+        self.disk = DiskCache(os.path.join(directory, "documents.sqlite"), disk_bytes)
+
+    def get(self, digest: str):
+        """Look up extracted text, promoting disk hits into memory
+
+        Args:
+            digest: SHA-256 hex digest of the source file
+
+        Returns:
+            str | None: Cached text, or None on a miss in both tiers
+        """
+        text = self.memory.get(digest)
+        if text is not None:
+            return text
+        blob = self.disk.get(digest)
+        if blob is None:
+            return None
+        encoded = zlib.decompress(blob)
+        text = encoded.decode("utf-8")
+        # Sized in UTF-8 bytes: counting characters would overshoot the budget on non-ASCII text
+        self.memory.put(digest, text, len(encoded))
+        return text
+
+    def put(self, digest: str, text: str):
+        encoded = text.encode("utf-8")
+        self.memory.put(digest, text, len(encoded))
+        self.disk.put(digest, zlib.compress(encoded))
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
+
+
+document_cache = DocumentCache()
@@ -0,0 +1,139 @@
+## Importing libraries and files
+import os
+import re
+
+from metrics import estimate_tokens, registry, stage
+from verification import verification_status
+
+## Compaction configuration (overridable through environment variables)
+# Pass downstream tasks a structured summary of each upstream report instead of the full text
+COMPACTION_ENABLED = os.getenv("COMPACTION_ENABLED", "true").lower() not in ("0", "false", "no")
+COMPACTION_MAX_METRICS = int(os.getenv("COMPACTION_MAX_METRICS", "24"))
+COMPACTION_MAX_FLAGS = int(os.getenv("COMPACTION_MAX_FLAGS", "10"))
+COMPACTION_MAX_ITEM_CHARS = int(os.getenv("COMPACTION_MAX_ITEM_CHARS", "200"))
+# Reports with nothing structured to extract are truncated to this length instead
+COMPACTION_FALLBACK_CHARS = int(os.getenv("COMPACTION_FALLBACK_CHARS", "1500"))
+
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_METRIC = re.compile(r"^([A-Za-z][^:]{1,60}?):\s*(.+)$")
+# "## Heading", "**Heading**:" or "3. **Heading** (Top 5) [High]: optional inline content"
+_HEADING = re.compile(r"^(?:#+\s*(.+)|(?:\d+[.)]\s*)?\*\*([^*]+)\*\*(.*))$")
+_LEVEL = re.compile(r"^(.{3,60}?)\s*\[(low|medium|high)\]", re.IGNORECASE)
+_FLAG_SECTION = re.compile(
+    r"red flag|concern|weakness|risk factor|anomal|inconsisten|missing|warning|risks?\b", re.IGNORECASE
+)
+_MEASURE_SECTION = re.compile(r"metric|ratio", re.IGNORECASE)
+_RECOMMENDATION = re.compile(r"recommend[^\n]*?\b(BUY|HOLD|SELL)\b", re.IGNORECASE)
+_RISK_PROFILE = re.compile(r"overall risk(?:\s+(?:profile|level|rating))?[^\n]*?\b(LOW|MEDIUM|HIGH)\b", re.IGNORECASE)
+_VERDICT_LINE = re.compile(r"verification\s+status|overall risk|recommendation", re.IGNORECASE)
+
+
+def _clip(text: str) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    return text if len(text) <= COMPACTION_MAX_ITEM_CHARS else text[:COMPACTION_MAX_ITEM_CHARS - 3] + "..."
+
+
+def _verdicts(raw: str) -> list:
+    verdicts = []
+    status = verification_status(raw)
+    if status:
+        verdicts.append(f"Verification Status: {status}")
+    for label, pattern in (("Recommendation", _RECOMMENDATION), ("Overall Risk", _RISK_PROFILE)):
+        match = pattern.search(raw)
+        if match:
+            verdicts.append(f"{label}: {match.group(1).upper()}")
+    return verdicts
+
+
+def compact_report(raw: str) -> str:
+    """Compact structured summary of an agent's markdown report
+
+    Keeps the verdicts (verification status, BUY/HOLD/SELL, overall risk), every
+    "Label: value" line that carries a number, risk levels given as "[Low]" etc.,
+    and the bullet points of flag-like sections (red flags, concerns, risk factors).
+    Prose is dropped. Reports with nothing of the kind are truncated instead, and
+    the summary is never longer than the report.
+    """
+    raw = raw or ""
+    metrics, levels, flags = {}, [], []
+    section = ""
+
+    def add(label: str, value: str, bullet: bool):
+        # Verdict lines are summarized separately
+        if _VERDICT_LINE.search(label):
+            return
+        flaggy = _FLAG_SECTION.search(label) or (
+            bullet and _FLAG_SECTION.search(section) and not _MEASURE_SECTION.search(section)
+        )
+        if flaggy:
+            if len(flags) < COMPACTION_MAX_FLAGS:
+                flags.append(_clip(f"{label}: {value}" if label else value))
+        elif label and re.search(r"\d", value) and len(metrics) < COMPACTION_MAX_METRICS:
+            metrics.setdefault(label, _clip(value))
+
+    for line in raw.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        level = _LEVEL.match(stripped.replace("**", "").lstrip("-*•# "))
+        if level:
+            levels.append(f"{level.group(1).strip()}: {level.group(2).capitalize()}")
+        heading = _HEADING.match(stripped)
+        if heading:
+            section = (heading.group(1) or heading.group(2)).replace("**", "").strip(" :")
+            # Parenthesized or bracketed qualifiers are part of the heading, not content
+            inline = re.sub(r"\([^)]*\)|\[[^\]]*\]", "", heading.group(3) or "").strip(" :")
+            if inline:
+                add(section, inline, bullet=False)
+            continue
+        bullet = bool(_BULLET.match(stripped))
+        item = _BULLET.sub("", stripped).replace("**", "")
+        metric = _METRIC.match(item)
+        if metric:
+            add(metric.group(1).strip(), metric.group(2).strip(), bullet)
+        elif bullet:
+            add("", item, bullet)
+
+    verdicts = _verdicts(raw)
+    if not (verdicts or metrics or levels or flags):
+        summary = raw[:COMPACTION_FALLBACK_CHARS]
+        return summary if len(summary) == len(raw) else summary.rstrip() + "\n[...truncated]"
+
+    lines = list(verdicts)
+    if levels:
+        lines.append("Risk Levels: " + "; ".join(dict.fromkeys(levels)))
+    if metrics:
+        lines.append("Metrics:")
+        lines.extend(f"- {label}: {value}" for label, value in metrics.items())
+    if flags:
+        lines.append("Flags:")
+        lines.extend(f"- {flag}" for flag in flags)
+    summary = "\n".join(lines)
+    return summary if len(summary) < len(raw) else raw
+
+
+def compact_output(output):
+    """Copy of a TaskOutput whose raw text is its compact summary (what downstream tasks read)"""
+    return output.model_copy(update={"raw": compact_report(output.raw)})
+
+
+def record_context(task, full_outputs: dict):
+    """Record the prompt tokens of a task's context in full and compacted form
+
+    The context is repeated in every LLM call the task makes, so the difference is
+    saved on each of them.
+
+    Args:
+        task: A task that has run; its upstream tasks hold their compacted outputs
+        full_outputs: id(task) -> full TaskOutput of the compacted upstream tasks
+    """
+    context = task.context if isinstance(task.context, list) else []
+    outputs = [(upstream.output, full_outputs.get(id(upstream), upstream.output))
+               for upstream in context if upstream.output is not None]
+    if not outputs:
+        return
+    with stage("context_compaction", task=task.name or "") as span:
+        span["context_tokens_full"] = sum(estimate_tokens(full.raw) for _, full in outputs)
+        span["context_tokens_compact"] = sum(estimate_tokens(compact.raw) for compact, _ in outputs)
+    registry.increment("fda_context_tokens_total", span["context_tokens_full"], (("form", "full"),))
+    registry.increment("fda_context_tokens_total", span["context_tokens_compact"], (("form", "compact"),))
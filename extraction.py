@@ -0,0 +1,289 @@
+## Importing libraries and files
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from ingest import BufferReader
+from metrics import record, stage
+from ocr import OCR_STREAM_BATCH, ocr_page_texts, ocr_pages
+
+## Extraction configuration (overridable through environment variables)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Below this page count the process pool costs more than it saves
+PARALLEL_MIN_PAGES = int(os.getenv("EXTRACTION_PARALLEL_MIN_PAGES", "32"))
+
+_EXCESS_NEWLINES = re.compile(r"\n{3,}")
+
+_pools = {}  # (name, workers) -> ProcessPoolExecutor
+_pools_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of three or more newlines into a single blank line
+
+    Equivalent to repeatedly replacing "\\n\\n\\n" with "\\n\\n", but done in one pass.
+    """
+    return _EXCESS_NEWLINES.sub("\n\n", text)
+
+
+def join_pages(pages: list) -> str:
+    """Join per-page text in page order, skipping pages without text, and normalize"""
+    return normalize_text("".join(page_text + "\n" for page_text in pages if page_text))
+
+
+class NewlineCollapser:
+    """Incremental form of normalize_text for text that arrives in pieces
+
+    Feeding pieces one at a time yields the same text as normalizing their
+    concatenation, including blank-line runs that straddle piece boundaries.
+    """
+
+    def __init__(self):
+        self._trailing = 0  # newlines at the end of what has been emitted so far
+
+    def feed(self, text: str) -> str:
+        if not text:
+            return ""
+        body = text.lstrip("\n")
+        leading = len(text) - len(body)
+        if self._trailing + leading >= 3:
+            # Leading newlines extend the run left over from the previous piece
+            leading = max(0, 2 - self._trailing)
+        if not body:
+            self._trailing += leading
+            return "\n" * leading
+        body = normalize_text(body)
+        self._trailing = len(body) - len(body.rstrip("\n"))
+        return "\n" * leading + body
+
+
+def _page_text(page) -> str:
+    """Extract a page's text, then drop the layout objects pdfplumber cached for it"""
+    try:
+        return page.extract_text() or ""
+    finally:
+        if hasattr(page, "close"):
+            page.close()
+        else:
+            page.flush_cache()
+
+
+def _timed_page_text(page) -> tuple:
+    start = time.perf_counter()
+    return _page_text(page), time.perf_counter() - start
+
+
+@contextmanager
+def open_pdf(source, pages: list = None):
+    """Open a PDF from a file path or from an in-memory buffer (bytes or memoryview)
+
+    Buffers are read in place through a BufferReader, without copying them.
+    """
+    # pdfplumber and pdfminer are slow to import, so they load with the first document
+    import pdfplumber
+
+    if isinstance(source, str):
+        with pdfplumber.open(source, pages=pages) as pdf:
+            yield pdf
+        return
+    with BufferReader(source) as reader, pdfplumber.open(reader, pages=pages) as pdf:
+        yield pdf
+
+
+def _extract_range(source, start: int, stop: int) -> list:
+    """Extract (text, seconds) for pages [start, stop) of a PDF (runs inside pool workers)"""
+    with open_pdf(source, pages=list(range(start + 1, stop + 1))) as pdf:
+        return [_timed_page_text(page) for page in pdf.pages]
+
+
+def process_pool(name: str, workers: int) -> ProcessPoolExecutor:
+    """Long-lived process pool for one kind of work, created on first use
+
+    Worker start-up is too slow to pay per document. Pools are kept per name (so
+    e.g. OCR cannot starve extraction) and per worker count, so callers asking for
+    different sizes at the same time each keep theirs instead of replacing it.
+    """
+    with _pools_lock:
+        pool = _pools.get((name, workers))
+        if pool is None:
+            pool = _pools[(name, workers)] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def count_pages(source) -> int:
+    with open_pdf(source) as pdf:
+        return len(pdf.pages)
+
+
+def extract_pages(source, workers: int = None) -> list:
+    """Extract the text of every page of a PDF, in page order
+
+    Page ranges are spread across a process pool for large documents. The serial
+    path produces exactly the same list. Scanned pages (no text, but images) are
+    then recognized with OCR when it is enabled.
+
+    Args:
+        source: Path of the pdf file, or its bytes
+        workers: Number of worker processes (defaults to EXTRACTION_WORKERS)
+
+    Returns:
+        list[str]: Text of each page ("" for pages without extractable text)
+    """
+    workers = EXTRACTION_WORKERS if workers is None else workers
+    with stage("pdf_extraction") as span:
+        page_count = count_pages(source)
+        parallel = workers > 1 and page_count >= PARALLEL_MIN_PAGES
+        if not parallel:
+            timed_pages = _extract_range(source, 0, page_count)
+        else:
+            if isinstance(source, str):
+                # A few ranges per worker keeps the pool busy when pages vary in cost
+                payload, range_count = source, min(page_count, workers * 4)
+            else:
+                # In-memory documents are pickled to the workers, so send one range each
+                payload, range_count = bytes(source), min(page_count, workers)
+            bounds = [page_count * i // range_count for i in range(range_count + 1)]
+            pool = process_pool("extraction", workers)
+            futures = [
+                pool.submit(_extract_range, payload, start, stop)
+                for start, stop in zip(bounds, bounds[1:])
+            ]
+            timed_pages = []
+            for future in futures:
+                timed_pages.extend(future.result())
+        span["pages"] = page_count
+        span["workers"] = workers if parallel else 1
+
+    # Per-page timings are measured inside the workers and recorded here
+    for page_number, (_, seconds) in enumerate(timed_pages, start=1):
+        record("pdf_page_extract", seconds, page=page_number)
+    return ocr_pages(source, [page_text for page_text, _ in timed_pages])
+
+
+def _extract_document(source) -> list:
+    """Extract (text, seconds) for every page of a PDF (runs inside pool workers)"""
+    with open_pdf(source) as pdf:
+        return [_timed_page_text(page) for page in pdf.pages]
+
+
+def extract_documents(sources: list, workers: int = None):
+    """Extract many PDFs in parallel, one whole document per pool task
+
+    Spreading documents rather than page ranges across the pool keeps every
+    worker busy without splitting small filings.
+
+    Args:
+        sources: Paths of the pdf files, or their bytes
+        workers: Number of worker processes (defaults to EXTRACTION_WORKERS)
+
+    Yields:
+        tuple[int, list[str] | Exception]: Position in sources and the page texts, in
+            completion order; a document that failed to extract yields its exception
+    """
+    workers = EXTRACTION_WORKERS if workers is None else workers
+    pool = process_pool("extraction", max(1, workers))
+    futures = {
+        pool.submit(_extract_document, source if isinstance(source, str) else bytes(source)): position
+        for position, source in enumerate(sources)
+    }
+    for future in as_completed(futures):
+        position = futures[future]
+        try:
+            timed_pages = future.result()
+            for page_number, (_, seconds) in enumerate(timed_pages, start=1):
+                record("pdf_page_extract", seconds, page=page_number)
+            pages = ocr_pages(sources[position], [page_text for page_text, _ in timed_pages])
+        except Exception as e:
+            yield position, e
+            continue
+        yield position, pages
+
+
+def extract_text(source, workers: int = None) -> str:
+    """Extract the normalized full text of a PDF
+
+    Args:
+        source: Path of the pdf file, or its bytes
+        workers: Number of worker processes (defaults to EXTRACTION_WORKERS)
+
+    Returns:
+        str: Document text with extra blank lines removed
+    """
+    return join_pages(extract_pages(source, workers))
+
+
+## Streaming API
+def iter_pages(source):
+    """Yield the normalized text of each page of a PDF, one page at a time
+
+    Only the current page's layout objects are alive at any point, so memory use
+    does not grow with the page count. Concatenating the yielded strings gives
+    the same text as extract_text().
+
+    Runs of pages without extractable text are held back (as page numbers, up to
+    OCR_STREAM_BATCH of them) and recognized together, so scanned pages are yielded
+    a batch at a time rather than one OCR round-trip per page.
+
+    Args:
+        source: Path of the pdf file, or its bytes
+
+    Yields:
+        str: Normalized text of the next page that has extractable text
+    """
+    collapser = NewlineCollapser()
+    scanned = []  # (page number, extracted text) of text-less pages waiting for OCR, all before the current page
+
+    def recognized():
+        texts = ocr_page_texts(source, [page_number for page_number, _ in scanned])
+        for page_number, page_text in scanned:
+            # As in ocr_pages(), pages OCR did not handle keep their own (whitespace) text
+            page_text = texts.get(page_number, page_text)
+            if page_text:
+                yield collapser.feed(page_text + "\n")
+        scanned.clear()
+
+    with open_pdf(source) as pdf:
+        for page_number, page in enumerate(pdf.pages, start=1):
+            page_text, seconds = _timed_page_text(page)
+            record("pdf_page_extract", seconds, page=page_number)
+            if not page_text.strip():
+                scanned.append((page_number, page_text))
+                if len(scanned) >= OCR_STREAM_BATCH:
+                    yield from recognized()
+                continue
+            # Earlier scanned pages come first
+            yield from recognized()
+            if page_text:
+                yield collapser.feed(page_text + "\n")
+        yield from recognized()
+
+
+def iter_chunks(source, chunk_chars: int = 8000):
+    """Yield the normalized document text in chunks of roughly chunk_chars characters
+
+    Chunks break on page boundaries where possible; a single page longer than
+    chunk_chars is split so no chunk exceeds the limit.
+
+    Args:
+        source: Path of the pdf file, or its bytes
+        chunk_chars: Maximum number of characters per chunk
+
+    Yields:
+        str: Next chunk of document text
+    """
+    buffer = []
+    buffered = 0
+    for page_text in iter_pages(source):
+        if buffered and buffered + len(page_text) > chunk_chars:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+        while len(page_text) > chunk_chars:
+            yield page_text[:chunk_chars]
+            page_text = page_text[chunk_chars:]
+        buffer.append(page_text)
+        buffered += len(page_text)
+    if buffer:
+        yield "".join(buffer)
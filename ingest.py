@@ -0,0 +1,260 @@
+## Importing libraries and files
+import hashlib
+import io
+import json
+import mmap
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+
+from cache import sha256_file
+
+## Ingestion configuration (overridable through environment variables)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Uploads up to this size stay in memory; larger ones spill to an mmapped temporary file
+SPOOL_MEMORY_BYTES = int(os.getenv("SPOOL_MEMORY_BYTES", str(16 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Whole request bodies are capped before the multipart parser spools them: one upload
+# plus room for the form fields, and several uploads for the batch endpoint
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(MAX_UPLOAD_BYTES + 1024 * 1024)))
+MAX_BATCH_REQUEST_BYTES = int(os.getenv("MAX_BATCH_REQUEST_BYTES", str(10 * MAX_REQUEST_BYTES)))
+
+DOCUMENT_REF_PREFIX = "document:"
+
+
+class UploadTooLargeError(ValueError):
+    """Raised as soon as an upload grows past MAX_UPLOAD_BYTES"""
+
+
+class RequestSizeLimit:
+    """ASGI middleware rejecting request bodies larger than a limit with a 413
+
+    Starlette's multipart parser reads the whole body (spooling files to temporary
+    files) before an endpoint runs, so the per-upload check in ingest_upload() comes
+    too late to save that work. This refuses a request whose Content-Length is over
+    the limit without reading it, and stops reading a body without one as soon as it
+    grows past the limit.
+
+    Args:
+        app: ASGI application to wrap
+        max_bytes: Limit for requests whose path has no entry in path_limits
+        path_limits: Path -> limit for endpoints that accept more (or less)
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # The app sees a disconnect and abandons the body; the client gets the 413
+                    rejected = True
+                    await self._reject(send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request body exceeds the {limit} byte limit"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview, with its own position
+
+    Several readers can share one upload buffer without copying it or
+    interfering with each other's position.
+    """
+
+    def __init__(self, view):
+        self._view = memoryview(view)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = max(0, min(len(buffer), len(self._view) - self._position))
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+@dataclass
+class IngestedDocument:
+    """An uploaded document held in memory (or an mmapped spill file) for the whole analysis"""
+    sha256: str
+    size: int
+    filename: str
+    view: memoryview
+    path: str = None  # spill file path for large uploads, so pool workers can open it directly
+    _resources: list = field(default_factory=list, repr=False)
+
+    @property
+    def ref(self) -> str:
+        return f"{DOCUMENT_REF_PREFIX}{self.sha256}"
+
+    @property
+    def source(self):
+        """What the extractors should read: the spill file path, or the in-memory bytes"""
+        return self.path or self.view
+
+    def close(self):
+        self.view.release()
+        for resource in reversed(self._resources):
+            resource.close()
+        self._resources.clear()
+
+
+async def ingest_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> IngestedDocument:
+    """Copy an UploadFile into the document buffer, hashing it and enforcing the size limit
+
+    By the time an endpoint runs, Starlette's multipart parser has already spooled
+    the file (in memory up to 1 MB, then to a temporary file); this copies it in
+    chunks into the buffer the analysis keeps. Oversized requests are refused
+    earlier, before parsing, by RequestSizeLimit.
+
+    Args:
+        upload: FastAPI/Starlette UploadFile
+        max_bytes: Reject the upload once more than this many bytes have been copied
+
+    Returns:
+        IngestedDocument: The buffered document and its SHA-256
+
+    Raises:
+        UploadTooLargeError: The upload exceeded max_bytes
+    """
+    digest = hashlib.sha256()
+    memory = bytearray()
+    spill = None
+    size = 0
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds the {max_bytes} byte limit")
+            digest.update(chunk)
+            if spill is None and len(memory) + len(chunk) > SPOOL_MEMORY_BYTES:
+                spill = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf")
+                spill.write(memory)
+                memory = bytearray()
+            if spill is None:
+                memory += chunk
+            else:
+                spill.write(chunk)
+    except BaseException:
+        if spill is not None:
+            spill.close()
+        raise
+
+    document = IngestedDocument(sha256=digest.hexdigest(), size=size, filename=upload.filename, view=memoryview(memory))
+    if spill is not None and size:
+        spill.flush()
+        mapped = mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ)
+        document.view = memoryview(mapped)
+        document.path = spill.name
+        document._resources.extend([spill, mapped])
+    return document
+
+
+## Registry of documents being analyzed, so tools can resolve a document reference
+_registry = {}  # ref -> [IngestedDocument, reference count]
+_registry_lock = threading.Lock()
+
+
+def register_document(document: IngestedDocument) -> str:
+    """Make a document resolvable by its reference until the matching release_document()
+
+    Concurrent analyses of the same bytes share one registered buffer.
+
+    Returns:
+        str: Reference to pass to tools in place of a file path
+    """
+    with _registry_lock:
+        entry = _registry.get(document.ref)
+        if entry is None:
+            _registry[document.ref] = [document, 1]
+            return document.ref
+        entry[1] += 1
+    # An identical document is already registered; this copy is not needed
+    document.close()
+    return document.ref
+
+
+def release_document(ref: str):
+    with _registry_lock:
+        entry = _registry.get(ref)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _registry[ref]
+    entry[0].close()
+
+
+def resolve_document(path: str) -> tuple:
+    """Resolve a tool's path argument to something the extractors can read
+
+    Args:
+        path: A registered document reference or a filesystem path
+
+    Returns:
+        tuple: (source, sha256) where source is a path or an in-memory buffer
+    """
+    with _registry_lock:
+        entry = _registry.get(path)
+    if entry is not None:
+        return entry[0].source, entry[0].sha256
+    return path, sha256_file(path)
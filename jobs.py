@@ -0,0 +1,397 @@
+## Importing libraries and files
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import SQLiteConnections
+
+## Job configuration (overridable through environment variables)
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "100"))
+# Seconds a shutting-down worker waits for its queued and running jobs to finish
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "300"))
+# A worker renews the lease of its unfinished jobs every third of this; a job whose
+# lease is older belongs to a dead worker (on any host) and no longer holds its key
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+ACTIVE = (QUEUED, RUNNING)
+
+# Identifies this worker process in the jobs it owns, across hosts sharing the store.
+# The boot nonce tells a restarted process apart from its predecessor with the same
+# PID (in a container the server is PID 1 after every restart).
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue already holds JOB_QUEUE_LIMIT unfinished jobs, or is draining"""
+
+
+class JobInProgressError(RuntimeError):
+    """Raised when a job with the same key is already queued or running in any worker"""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"An identical job is already in progress: {job_id}")
+        self.job_id = job_id
+
+
+def _worker_alive(worker: str, lease: float) -> bool:
+    """Whether the worker owning an unfinished job may still be running it
+
+    A lease older than JOB_LEASE_SECONDS means dead on any host. On this host a
+    worker is also dead once its PID has exited or been reused by another process
+    (same PID, different boot nonce).
+    """
+    if lease is None or time.time() - lease > JOB_LEASE_SECONDS:
+        return False
+    if worker == WORKER_ID:
+        return True
+    host, pid, _ = (worker or "").rsplit(":", 2) if (worker or "").count(":") >= 2 else ("", "", "")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+## Job state persistence
+class JobStore:
+    """SQLite-backed record of every job's status, progress and result
+
+    The store is shared by every worker process. A job may carry a key (e.g. document
+    hash and query); at most one job per key is queued or running at a time, which a
+    partial unique index enforces across processes.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._connect = SQLiteConnections(path, row_factory=sqlite3.Row)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, "
+                "stage TEXT, metadata TEXT, result TEXT, error TEXT, "
+                "created REAL NOT NULL, started REAL, finished REAL, job_key TEXT, worker TEXT, lease REAL)"
+            )
+            # Stores created before job keys and leases existed
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("job_key", "TEXT"), ("worker", "TEXT"), ("lease", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (job_key) "
+                f"WHERE status IN ('{QUEUED}', '{RUNNING}')"
+            )
+
+    def create(self, metadata: dict, key: str = None) -> str:
+        """Record a new queued job owned by this worker
+
+        Args:
+            metadata: JSON-serializable details stored with the job
+            key: Optional de-duplication key
+
+        Returns:
+            str: The new job's id
+
+        Raises:
+            JobInProgressError: A job with the same key is queued or running
+        """
+        job_id = str(uuid.uuid4())
+        attempts = 3
+        for attempt in range(attempts):
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT INTO jobs (id, status, metadata, created, job_key, worker, lease) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, QUEUED, json.dumps(metadata), time.time(), key, WORKER_ID, time.time()),
+                    )
+                return job_id
+            except sqlite3.IntegrityError:
+                # The job holding the key may have finished since, or belong to a crashed worker
+                active = self.active(key)
+                if active is not None and (attempt > 0 or _worker_alive(active["worker"], active["lease"])):
+                    raise JobInProgressError(active["id"])
+                if attempt == attempts - 1:
+                    raise
+                if active is not None:
+                    self.fail_orphans()
+
+    def active(self, key: str):
+        """The queued or running job with this key, or None"""
+        placeholders = ", ".join("?" for _ in ACTIVE)
+        row = self._connect().execute(
+            f"SELECT id, worker, lease FROM jobs WHERE job_key = ? AND status IN ({placeholders})", (key, *ACTIVE)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def fail_orphans(self) -> int:
+        """Fail unfinished jobs whose worker has exited (e.g. crashed) or stopped renewing their lease
+
+        Returns:
+            int: Number of jobs failed
+        """
+        placeholders = ", ".join("?" for _ in ACTIVE)
+        rows = self._connect().execute(
+            f"SELECT id, worker, lease FROM jobs WHERE status IN ({placeholders})", ACTIVE
+        ).fetchall()
+        orphans = [row["id"] for row in rows if not _worker_alive(row["worker"], row["lease"])]
+        return sum(
+            self.finish(job_id, FAILED, error="The worker running this job exited") for job_id in orphans
+        )
+
+    def renew(self, job_ids: list):
+        """Extend the lease of this worker's unfinished jobs"""
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET lease = ? WHERE id IN ({placeholders})", (time.time(), *job_ids))
+
+    def start(self, job_id: str) -> bool:
+        """Mark a queued job running; False if it was failed meanwhile (e.g. by a drain)"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+        return cursor.rowcount > 0
+
+    def finish(self, job_id: str, status: str, **fields) -> bool:
+        """Record a job's final status unless it already has one
+
+        A job failed by a draining or recovering worker stays failed, even if the
+        crew behind it completes later.
+
+        Returns:
+            bool: Whether the job was still unfinished
+        """
+        fields = {"status": status, "finished": time.time(), **fields}
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        placeholders = ", ".join("?" for _ in ACTIVE)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ? AND status IN ({placeholders})",
+                (*fields.values(), job_id, *ACTIVE),
+            )
+        return cursor.rowcount > 0
+
+    def wait(self, job_id: str, poll_seconds: float = 1.0) -> dict:
+        """Block until a job (run by any worker) is no longer queued or running"""
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] not in ACTIVE:
+                return job
+            time.sleep(poll_seconds)
+
+    def update(self, job_id: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        """Fetch a job as a plain dict
+
+        Args:
+            job_id: Identifier returned when the job was submitted
+
+        Returns:
+            dict | None: Job record, or None if the id is unknown
+        """
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["metadata"] = json.loads(job["metadata"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+## Background execution
+class JobQueue:
+    """Bounded thread pool that runs submitted jobs and records their state in a JobStore"""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, limit: int = JOB_QUEUE_LIMIT):
+        self.store = store
+        self.limit = limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._pending = set()  # ids of this worker's queued and running jobs
+        self._waiting = {}     # job id -> on_skip callback of jobs not started yet
+        self._draining = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        threading.Thread(target=self._renew_leases, name="job-lease", daemon=True).start()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(JOB_LEASE_SECONDS / 3)
+            with self._lock:
+                job_ids = [job_id for job_id in self._pending if isinstance(job_id, str)]
+            try:
+                self.store.renew(job_ids)
+            except Exception as e:
+                print(f"Could not renew job leases: {str(e)}")
+
+    def submit(self, fn, metadata: dict = None, key: str = None, on_skip=None) -> str:
+        """Queue fn for background execution
+
+        fn is called as fn(progress) where progress(stage, fraction) records how far
+        the job has got. Its return value must be JSON-serializable.
+
+        Args:
+            fn: Callable doing the work
+            metadata: JSON-serializable details stored with the job
+            key: Optional de-duplication key; no two jobs with the same key run at once,
+                in this worker or any other sharing the store
+            on_skip: Optional callable(error) run instead of fn when the job is failed
+                before it starts (by a drain, or as an orphan), to release what fn
+                would have cleaned up
+
+        Returns:
+            str: Job id to poll with JobStore.get
+
+        Raises:
+            QueueFullError: The queue is full, or draining for shutdown
+            JobInProgressError: A job with the same key is queued or running
+        """
+        reservation = object()
+        with self._lock:
+            if self._draining:
+                raise QueueFullError("Worker is shutting down and accepts no new jobs")
+            if len(self._pending) >= self.limit:
+                raise QueueFullError(f"Job queue is full ({self.limit} jobs pending)")
+            self._pending.add(reservation)
+        try:
+            job_id = self.store.create(metadata or {}, key)
+        finally:
+            with self._lock:
+                self._pending.discard(reservation)
+        with self._lock:
+            self._pending.add(job_id)
+            self._waiting[job_id] = on_skip
+        self._executor.submit(self._run, job_id, fn)
+        return job_id
+
+    def claim(self, metadata: dict = None, key: str = None) -> str:
+        """Record a running job that the caller executes on its own thread
+
+        For work with its own concurrency (batch crews) that must still hold its
+        de-duplication key, keep its lease and be waited for by drain(). Finish it
+        with release().
+
+        Returns:
+            str: The job's id
+
+        Raises:
+            QueueFullError: The worker is draining for shutdown
+            JobInProgressError: A job with the same key is queued or running
+        """
+        reservation = object()
+        with self._lock:
+            if self._draining:
+                raise QueueFullError("Worker is shutting down and accepts no new jobs")
+            self._pending.add(reservation)
+        try:
+            job_id = self.store.create(metadata or {}, key)
+            with self._lock:
+                self._pending.add(job_id)
+        finally:
+            with self._lock:
+                self._pending.discard(reservation)
+        self.store.start(job_id)
+        return job_id
+
+    def release(self, job_id: str, status: str, **fields) -> bool:
+        """Record the final status of a claimed job (see JobStore.finish)"""
+        try:
+            return self.store.finish(job_id, status, **fields)
+        finally:
+            with self._lock:
+                self._pending.discard(job_id)
+                self._idle.notify_all()
+
+    @staticmethod
+    def _skip(job_id: str, on_skip, error: str):
+        if on_skip is None:
+            return
+        try:
+            on_skip(error)
+        except Exception as e:
+            print(f"Cleanup of skipped job {job_id} failed: {str(e)}")
+
+    def _run(self, job_id: str, fn):
+        def progress(stage: str, fraction: float):
+            self.store.update(job_id, stage=stage, progress=fraction)
+
+        with self._lock:
+            if job_id not in self._waiting:
+                # A drain already failed the job and ran its on_skip
+                return
+            on_skip = self._waiting.pop(job_id)
+        if not self.store.start(job_id):
+            job = self.store.get(job_id)
+            self._skip(job_id, on_skip, (job or {}).get("error") or "The job was failed before it started")
+            with self._lock:
+                self._pending.discard(job_id)
+                self._idle.notify_all()
+            return
+        try:
+            result = fn(progress)
+            if not self.store.finish(job_id, COMPLETED, progress=1.0, result=json.dumps(result)):
+                print(f"Job {job_id} finished after it was marked failed; result discarded")
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            traceback.print_exc()
+            self.store.finish(job_id, FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._pending.discard(job_id)
+                self._idle.notify_all()
+
+    def drain(self, timeout: float = SHUTDOWN_GRACE_SECONDS) -> int:
+        """Stop accepting jobs and wait up to timeout seconds for the pending ones to finish
+
+        Jobs still unfinished afterwards are marked failed, so that clients polling
+        them (through any worker) get an answer and their keys can be submitted again.
+        Those that never started get their on_skip callback.
+
+        Returns:
+            int: Number of jobs that did not finish in time
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._draining = True
+            while self._pending and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            unfinished = [job_id for job_id in self._pending if isinstance(job_id, str)]
+            # Taken over here, so their _run (if it is still scheduled) returns at once
+            skipped = {job_id: self._waiting.pop(job_id) for job_id in unfinished if job_id in self._waiting}
+            self._pending.difference_update(skipped)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        error = "Interrupted: the worker shut down before the job finished"
+        for job_id in unfinished:
+            self.store.finish(job_id, FAILED, error=error)
+        for job_id, on_skip in skipped.items():
+            self._skip(job_id, on_skip, error)
+        return len(unfinished)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,173 @@
+## Importing libraries and files
+import contextvars
+import hashlib
+import json
+import os
+
+import litellm
+from crewai import LLM
+
+from cache import CACHE_DIR, DiskCache
+from metrics import estimate_tokens, registry, stage
+from ratelimit import LLM_MAX_RETRIES, is_rate_limited, llm_scheduler, retry_after_seconds
+
+## LLM cache configuration (overridable through environment variables)
+# off: always call the provider; readwrite: serve hits, record misses;
+# replay: serve hits only and fail on a miss (no network access needed)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "readwrite")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_BYTES = int(os.getenv("LLM_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+LLM_CACHE_MODES = ("off", "readwrite", "replay")
+
+# Request parameters that change the completion and therefore belong in the key
+KEY_PARAMETERS = (
+    "model", "base_url", "api_base", "temperature", "top_p", "n", "stop", "max_tokens",
+    "max_completion_tokens", "presence_penalty", "frequency_penalty", "logit_bias", "seed",
+    "reasoning_effort",
+)
+
+
+class LLMCacheMissError(RuntimeError):
+    """Raised in replay mode when a request has no recorded response"""
+
+
+_store = None
+
+
+def get_store() -> DiskCache:
+    # Opened on first use so importing agents does not touch the disk
+    global _store
+    if _store is None:
+        _store = DiskCache(os.path.join(CACHE_DIR, "llm.sqlite"), LLM_CACHE_BYTES, ttl=LLM_CACHE_TTL)
+    return _store
+
+
+class UsageRecorder:
+    """Token usage the provider reported for one LLM call"""
+
+    def __init__(self):
+        self.usage = None
+
+    def tokens(self, kind: str):
+        """Reported prompt or completion token count, None if the provider gave none"""
+        field = f"{kind}_tokens"
+        value = self.usage.get(field) if isinstance(self.usage, dict) else getattr(self.usage, field, None)
+        return value if isinstance(value, int) else None
+
+
+## Usage capture
+# crewai only exposes usage through callbacks, which it installs as litellm's global
+# callbacks on every call; litellm.completion is wrapped once instead, and hands the
+# usage of each response to the recorder of the call running in the same context
+_usage_recorder = contextvars.ContextVar("usage_recorder", default=None)
+
+
+def _stream_with_usage(chunks, recorder: UsageRecorder):
+    for chunk in chunks:
+        usage = chunk.get("usage") if isinstance(chunk, dict) else getattr(chunk, "usage", None)
+        if usage and not isinstance(usage, type):
+            recorder.usage = usage
+        yield chunk
+
+
+def _completion_with_usage(*args, **kwargs):
+    response = _completion(*args, **kwargs)
+    recorder = _usage_recorder.get()
+    if recorder is None:
+        return response
+    if kwargs.get("stream"):
+        return _stream_with_usage(response, recorder)
+    recorder.usage = getattr(response, "usage", None) or recorder.usage
+    return response
+
+
+_completion = getattr(litellm.completion, "wrapped", litellm.completion)
+_completion_with_usage.wrapped = _completion
+litellm.completion = _completion_with_usage
+
+
+class CachedLLM(LLM):
+    """LLM whose text completions are cached on disk, keyed by model, messages and parameters"""
+
+    def __init__(self, *args, cache_mode: str = LLM_CACHE_MODE, **kwargs):
+        super().__init__(*args, **kwargs)
+        if cache_mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode {cache_mode!r}; expected one of {LLM_CACHE_MODES}")
+        self.cache_mode = cache_mode
+
+    def cache_key(self, messages, tools=None) -> str:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        request = {name: getattr(self, name, None) for name in KEY_PARAMETERS}
+        request["messages"] = messages
+        request["tools"] = tools
+        encoded = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None):
+        prompt = messages if isinstance(messages, str) else "".join(
+            str(message.get("content") or "") for message in messages
+        )
+        with stage("llm_call", model=self.model) as span:
+            # Replaced by the provider's usage when the call reaches it and reports one
+            span["prompt_tokens"] = estimate_tokens(prompt)
+            span["tokens_estimated"] = True
+            response = self._cached_call(messages, tools, callbacks, available_functions, span)
+            if span["tokens_estimated"] and isinstance(response, str):
+                span["completion_tokens"] = estimate_tokens(response)
+            return response
+
+    def _cached_call(self, messages, tools, callbacks, available_functions, span: dict):
+        # Function-calling responses execute local code, so they are never replayed
+        if self.cache_mode == "off" or available_functions:
+            span["cache"] = "bypass"
+            return self._provider_call(messages, tools, callbacks, available_functions, span)
+
+        key = self.cache_key(messages, tools)
+        cached = get_store().get(key)
+        if cached is not None:
+            span["cache"] = "hit"
+            return cached.decode("utf-8")
+        span["cache"] = "miss"
+        if self.cache_mode == "replay":
+            raise LLMCacheMissError(f"No recorded LLM response for request {key[:12]} (replay mode)")
+
+        response = self._provider_call(messages, tools, callbacks, available_functions, span)
+        if isinstance(response, str):
+            get_store().put(key, response.encode("utf-8"))
+        return response
+
+    def _provider_call(self, messages, tools, callbacks, available_functions, span: dict):
+        # Only requests that reach the provider go through the shared scheduler; the
+        # reservation covers the prompt plus the longest completion we allow
+        estimate = span.get("prompt_tokens", 0) + (self.max_tokens or 1024)
+        span["rate_limit_wait_seconds"] = 0.0
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            with llm_scheduler.request(estimate) as reservation:
+                span["rate_limit_wait_seconds"] += reservation.waited
+                usage = UsageRecorder()
+                token = _usage_recorder.set(usage)
+                try:
+                    response = super().call(messages, tools, callbacks, available_functions)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == LLM_MAX_RETRIES:
+                        raise
+                    # Pauses every request in the scheduler, not just this retry
+                    delay = llm_scheduler.backoff(attempt, retry_after_seconds(e))
+                    registry.increment("fda_llm_rate_limited_total", labels=(("model", self.model),))
+                    span["rate_limited"] = attempt + 1
+                    print(f"LLM rate limited (attempt {attempt + 1}), retrying in {delay:.1f}s")
+                    continue
+                finally:
+                    _usage_recorder.reset(token)
+                prompt_tokens, completion_tokens = usage.tokens("prompt"), usage.tokens("completion")
+                if prompt_tokens is not None and completion_tokens is not None:
+                    span.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                tokens_estimated=False)
+                    reservation.tokens = prompt_tokens + completion_tokens
+                else:
+                    reservation.tokens = span.get("prompt_tokens", 0) + (
+                        estimate_tokens(response) if isinstance(response, str) else 0
+                    )
+                return response
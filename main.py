@@ -1,37 +1,147 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import json
 import os
+import threading
 import uuid
-from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import List
 
-from crewai import Crew, Process
-from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from task import analyze_financial_document, investment_analysis, risk_assessment, verification
+from batch import BATCH_CONCURRENCY, BATCH_ROOT, analyze_batch, discover_documents
+from ingest import (
+    MAX_BATCH_REQUEST_BYTES, RequestSizeLimit, UploadTooLargeError, ingest_upload, register_document,
+    release_document, resolve_document
+)
+from jobs import COMPLETED, FAILED, JOB_WORKERS, SHUTDOWN_GRACE_SECONDS, JobInProgressError, JobQueue, JobStore, QueueFullError
+from metrics import Trace, activate_trace, load_trace, registry, stage
+from results import ResultStore, normalize_query, task_outputs
+from extraction import extract_pages
+from retrieval import build_index
+from revisions import fingerprint_pages, plan_revision
+from verification import PRESCREEN_ENABLED, REJECTED, crew_verification_status, is_rejected, prescreen_document
+
+## Startup configuration (overridable through environment variables)
+# Import crewai and build the crew template in the background as soon as the worker starts
+CREW_PREWARM = os.getenv("CREW_PREWARM", "true").lower() not in ("0", "false", "no")
+# How often a stream following another request's job polls the shared job store
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+## Crew template
+# crewai and crewai_tools take seconds to import, so the agents and tasks are only
+# imported when the template is first needed: by the prewarm thread, or the first analysis
+_crew_template = None
+_crew_template_lock = threading.Lock()
+
+def crew_template():
+    """This worker's CrewTemplate of the four analysis tasks, built on first use"""
+    global _crew_template
+    with _crew_template_lock:
+        if _crew_template is None:
+            from pipeline import CrewTemplate
+            from task import analyze_financial_document, investment_analysis, risk_assessment, verification
+            _crew_template = CrewTemplate(
+                [verification, analyze_financial_document, investment_analysis, risk_assessment],
+                max_idle=JOB_WORKERS + BATCH_CONCURRENCY
+            )
+    return _crew_template
+
+def prewarm():
+    """Import the crew and copy its tasks for every job worker ahead of the first request"""
+    with stage("prewarm") as span:
+        crew_template().fill(JOB_WORKERS)
+        span["copies"] = JOB_WORKERS
+    print("Crew template ready")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Jobs left queued or running by a crashed worker would block their keys forever
+    orphans = job_store.fail_orphans()
+    if orphans:
+        print(f"Marked {orphans} jobs of exited workers as failed")
+    if CREW_PREWARM:
+        # Off the event loop, so the worker accepts requests while it warms up
+        threading.Thread(target=prewarm, name="crew-prewarm", daemon=True).start()
+    yield
+    # Let in-flight crews finish before the worker exits; new submissions get a 503
+    print(f"Draining job queue (up to {SHUTDOWN_GRACE_SECONDS:.0f}s)")
+    interrupted = await asyncio.to_thread(job_queue.drain, SHUTDOWN_GRACE_SECONDS)
+    if interrupted:
+        print(f"{interrupted} jobs did not finish before shutdown and were marked failed")
 
 app = FastAPI(
     title="Financial Document Analyzer",
     description="AI-powered financial document analysis system using CrewAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# Oversized uploads are refused before the multipart parser spools them
+app.add_middleware(RequestSizeLimit, path_limits={"/analyze/batch": MAX_BATCH_REQUEST_BYTES})
+
+job_store = JobStore()
+job_queue = JobQueue(job_store)
+result_store = ResultStore()
 
-def run_crew(query: str, file_path: str = "data/sample.pdf"):
+def run_crew(query: str, file_path: str = "data/sample.pdf", task_callback=None, step_callback=None,
+             execution_mode: str = None, precomputed: dict = None, revision_context: str = ""):
     """Run the complete financial analysis crew with all agents and tasks
     
     Args:
         query: User's analysis question or request
-        file_path: Path to the financial document PDF
+        file_path: Path to the financial document PDF, or a registered document reference
+        task_callback: Optional callable invoked with each TaskOutput as its task completes
+        step_callback: Optional callable invoked with each intermediate agent step
+        execution_mode: "dag" runs tasks with satisfied context concurrently
+            (investment and risk in parallel); "sequential" runs them one by one;
+            CREW_EXECUTION_MODE when None
+        precomputed: Task name -> output reused instead of running the task (incremental re-analysis)
+        revision_context: Description of what changed since an earlier version of the document
         
     Returns:
-        CrewOutput: Complete analysis results from all tasks
+        CrewOutput: Complete analysis results from all tasks; only the verification
+            report when the document was rejected
     """
-    financial_crew = Crew(
-        agents=[verifier, financial_analyst, investment_advisor, risk_assessor],
-        tasks=[verification, analyze_financial_document, investment_analysis, risk_assessment],
-        process=Process.sequential,
-        verbose=True
-    )
-    
-    result = financial_crew.kickoff({'query': query})
-    return result
+    from pipeline import CREW_EXECUTION_MODE, EXECUTION_MODES, run_dag, run_sequential
+
+    execution_mode = execution_mode or CREW_EXECUTION_MODE
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {execution_mode!r}; expected one of {EXECUTION_MODES}")
+
+    # Tasks tell their agents which document to pass to the document tools
+    inputs = {'query': query, 'document': file_path, 'revision_context': revision_context}
+
+    # Junk uploads are rejected locally; the rejection stands in for the verification
+    # report and the gate below then skips every other task
+    prescreened = False
+    if PRESCREEN_ENABLED:
+        screen = prescreen_document(file_path)
+        if screen.rejected:
+            print(f"Pre-screen rejected {file_path}: {'; '.join(screen.reasons)}")
+            precomputed = {"verification": screen.report()}
+            prescreened = True
+
+    # Each run checks out its own copy of the tasks, so concurrent analyses (job
+    # workers, batches) never share task outputs
+    with crew_template().checkout() as tasks:
+        if execution_mode == "dag":
+            response = run_dag(
+                tasks, inputs, task_callback=task_callback, step_callback=step_callback,
+                precomputed=precomputed, stop_when=is_rejected
+            )
+        else:
+            response = run_sequential(
+                [task.agent for task in tasks],
+                tasks,
+                inputs,
+                task_callback=task_callback,
+                step_callback=step_callback,
+                precomputed=precomputed,
+                stop_when=is_rejected
+            )
+
+    if not prescreened and crew_verification_status(response) == REJECTED:
+        registry.increment("fda_documents_rejected_total", labels=(("stage", "verification"),))
+    return response
 
 @app.get("/")
 async def root():
@@ -41,33 +151,156 @@ async def root():
         "status": "healthy",
         "version": "1.0.0",
         "endpoints": {
-            "analyze": "/analyze - POST - Upload and analyze financial documents",
+            "analyze": "/analyze - POST - Upload a financial document and queue its analysis",
+            "analyze_stream": "/analyze/stream - POST - Upload and stream each task's output as server-sent events",
+            "analyze_batch": "/analyze/batch - POST - Analyze many uploads or a server directory, streaming NDJSON results",
+            "jobs": "/jobs/{job_id} - GET - Status, progress and result of a queued analysis",
+            "analyses": "/analyses - GET - Search stored analyses; /analyses/{analysis_id} for one",
+            "metrics": "/metrics - GET - Prometheus metrics for every pipeline stage",
+            "traces": "/traces/{trace_id} - GET - Per-request stage timings as JSON",
             "docs": "/docs - Interactive API documentation"
         }
     }
 
-@app.post("/analyze")
-async def analyze_document_endpoint(
-    file: UploadFile = File(..., description="Financial document PDF file"),
-    query: str = Form(
-        default="Provide a comprehensive financial analysis and investment recommendation",
-        description="Your analysis question or request"
-    )
-):
-    """Analyze financial document and provide comprehensive investment recommendations
+def index_document(document: str, digest: str, filename: str) -> tuple:
+    """Build a document's search index and make sure its page fingerprints are stored
+
+    Returns:
+        tuple: (page fingerprints, page texts); the texts are None when the
+            fingerprints were already stored and nothing had to be extracted
+    """
+    stored = result_store.get_pages(digest)
+    if stored is not None:
+        build_index(document)
+        return stored[1], None
+    source, _ = resolve_document(document)
+    pages = extract_pages(source)
+    build_index(document, pages=pages)
+    fingerprints = fingerprint_pages(pages)
+    result_store.save_pages(digest, filename, fingerprints)
+    return fingerprints, pages
+
+def analyze_document_job(query: str, document: str, filename: str, file_id: str, progress, observer=None,
+                         trace: Trace = None, base_document: str = None, incremental: bool = True) -> dict:
+    """Run the crew for one uploaded document (executes on a job worker thread)
+
+    If an earlier version of the document was analyzed for an equivalent query,
+    only the tasks whose inputs changed are re-run and the rest reuse its outputs.
+
+    Args:
+        query: Cleaned analysis question
+        document: Reference of the registered upload (released when the job ends)
+        filename: Original name of the uploaded file
+        file_id: Identifier used for the trace
+        progress: Callable(stage, fraction) recording job progress
+        observer: Optional callable(event, payload) notified of every step, task and the final result
+        trace: Request trace started at upload time; stages run here are added to it
+        base_document: SHA-256 of the earlier version; found by page overlap when omitted
+        incremental: Reuse task outputs of an earlier version where its pages did not change
+
+    Returns:
+        dict: Analysis result stored with the job
+    """
+    trace = trace or Trace(file_id)
+    activate_trace(trace)
+    total_tasks = 4
+    completed = []
+    notify = observer or (lambda event, payload: None)
+
+    def on_task_complete(output):
+        completed.append(output)
+        progress(output.agent, len(completed) / total_tasks)
+        notify("task", {
+            "index": len(completed),
+            "total": total_tasks,
+            "name": output.name,
+            "agent": output.agent,
+            "summary": output.summary,
+            "output": output.raw
+        })
+
+    def on_step(step):
+        notify("progress", {
+            "completed_tasks": len(completed),
+            "total": total_tasks,
+            "step": type(step).__name__,
+            "thought": str(getattr(step, "thought", ""))
+        })
+
+    try:
+        # Index the document up front so agent searches only score chunks
+        progress("indexing document", 0.0)
+        digest = resolve_document(document)[1]
+        fingerprints, pages = index_document(document, digest, filename)
+
+        # A revised filing only re-runs the tasks its changed pages affect
+        plan = None
+        if incremental:
+            with stage("revision_diff"):
+                plan = plan_revision(result_store, digest, fingerprints, query, base_document, pages)
+        if plan is not None:
+            print(f"Revision of {plan.base_sha256[:12]}: re-running {sorted(plan.rerun)}, reusing {sorted(plan.reused)}")
+            notify("revision", plan.summary())
+
+        progress("analysis started", 0.0)
+        with stage("crew"):
+            response = run_crew(
+                query=query,
+                file_path=document,
+                task_callback=on_task_complete,
+                step_callback=on_step if observer else None,
+                precomputed=plan.reused if plan else None,
+                revision_context=plan.context if plan else ""
+            )
+        
+        # Store the structured per-task outputs so an identical request is a lookup
+        revision = plan.summary() if plan else None
+        with stage("result_store"):
+            analysis_id = result_store.save(
+                digest, query, filename, str(response), task_outputs(response), revision=revision
+            )
+        
+        result = {
+            "analysis": str(response),
+            "analysis_id": analysis_id,
+            "analysis_url": f"/analyses/{analysis_id}",
+            "trace_id": trace.trace_id,
+            "verification_status": crew_verification_status(response),
+            "revision": revision
+        }
+        notify("complete", result)
+        return result
     
-    This endpoint:
-    1. Verifies the document is a valid financial report
-    2. Performs detailed financial analysis
-    3. Provides investment recommendations
-    4. Conducts risk assessment
+    except Exception as e:
+        notify("error", {"detail": str(e)})
+        raise
     
+    finally:
+        trace.save()
+
+        # Release the in-memory upload buffer
+        release_document(document)
+
+async def queue_upload(file: UploadFile, query: str, observer=None, refresh: bool = False,
+                       base_document: str = None) -> dict:
+    """Validate and ingest an upload, then queue its analysis job
+
+    The upload, already spooled by the multipart parser, is copied into memory
+    (large files spill to an mmapped temporary file) and hashed on the way; the
+    file itself is never saved under data/. If the same document was already
+    analyzed for an equivalent query, the stored analysis is returned instead of
+    queueing a job; a revision of an analyzed document only re-runs the affected
+    tasks.
+
     Args:
-        file: PDF file containing financial document (10-K, 10-Q, earnings report, etc.)
-        query: Your specific analysis question or investment objective
-        
+        file: Uploaded PDF
+        query: Raw analysis question from the form
+        observer: Optional callable(event, payload) passed through to the job
+        refresh: Re-run the full analysis even if a stored one (or an earlier version's) exists
+        base_document: SHA-256 of the earlier version this document revises, if known
+
     Returns:
-        Complete analysis including verification, financial metrics, investment advice, and risk assessment
+        dict: Queued-job summary, or the stored analysis (status "completed")
     """
     
     # Validate file type
@@ -78,18 +311,23 @@ async def analyze_document_endpoint(
         )
     
     file_id = str(uuid.uuid4())
-    file_path = f"data/financial_document_{file_id}.pdf"
+    document = None
+    queued = False
+    trace = Trace(file_id)
+    activate_trace(trace)
     
     try:
-        # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
-        
-        # Save uploaded file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            if len(content) == 0:
-                raise HTTPException(status_code=400, detail="Uploaded file is empty")
-            f.write(content)
+        # Copy the spooled upload into the document buffer, hashing it and enforcing the size limit
+        with stage("upload_ingest") as span:
+            ingested = await ingest_upload(file)
+            span["bytes"] = ingested.size
+        if ingested.size == 0:
+            ingested.close()
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        if base_document is not None and result_store.get_pages(base_document) is None:
+            ingested.close()
+            raise HTTPException(status_code=404, detail=f"Base document {base_document} has not been analyzed")
+        document = register_document(ingested)
         
         # Validate and clean query
         if not query or query.strip() == "":
@@ -97,55 +335,393 @@ async def analyze_document_endpoint(
         
         query = query.strip()
         
-        # Process the financial document with all analysts
-        print(f"Processing query: {query}")
-        print(f"Document: {file.filename} ({len(content)} bytes)")
-        
-        response = run_crew(query=query, file_path=file_path)
+        filename = file.filename
+        stored = None if refresh else result_store.lookup(ingested.sha256, query)
+        if stored is not None:
+            print(f"Serving stored analysis {stored['id']} for {filename}")
+            return {
+                "status": "completed",
+                "cached": True,
+                "analysis_id": stored["id"],
+                "analysis_url": f"/analyses/{stored['id']}",
+                "query": query,
+                "file_processed": filename,
+                "file_size_bytes": ingested.size,
+                "document_sha256": ingested.sha256,
+                "analysis": stored["analysis"],
+                "tasks": stored["tasks"]
+            }
         
-        # Ensure outputs directory exists
-        os.makedirs("outputs", exist_ok=True)
+        print(f"Queueing query: {query}")
+        print(f"Document: {filename} ({ingested.size} bytes, sha256 {ingested.sha256})")
         
-        # Generate output filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"financial_analysis_{timestamp}_{file_id}.txt"
-        output_path = os.path.join("outputs", output_filename)
-        
-        # Save analysis to file
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(f"Query: {query}\n")
-            f.write(f"Document: {file.filename}\n")
-            f.write(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 80 + "\n")
-            f.write(str(response))
+        def skipped(error: str):
+            # The job was failed before it started, so analyze_document_job never runs
+            try:
+                if observer is not None:
+                    observer("error", {"detail": error})
+            finally:
+                release_document(document)
+
+        # One job per document and query at a time, across every worker process
+        job_key = f"{ingested.sha256}:{normalize_query(query)}"
+        job_id = job_queue.submit(
+            lambda progress: analyze_document_job(
+                query, document, filename, file_id, progress, observer, trace,
+                base_document=base_document, incremental=not refresh
+            ),
+            metadata={
+                "query": query,
+                "file_processed": filename,
+                "file_size_bytes": ingested.size,
+                "document_sha256": ingested.sha256,
+                "base_document": base_document
+            },
+            key=job_key,
+            on_skip=skipped
+        )
+        queued = True
         
         return {
-            "status": "success",
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "trace_url": f"/traces/{trace.trace_id}",
             "query": query,
-            "file_processed": file.filename,
-            "file_size_bytes": len(content),
-            "analysis": str(response),
-            "output_file": output_path,
-            "message": "Financial analysis completed successfully and saved to outputs directory"
+            "file_processed": filename,
+            "file_size_bytes": ingested.size,
+            "document_sha256": ingested.sha256,
+            "message": "Financial analysis queued; poll the status URL for progress and results"
+        }
+    
+    except HTTPException:
+        raise
+    
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    except JobInProgressError as e:
+        # Follow the identical analysis already under way instead of running it twice
+        print(f"Joining job {e.job_id} already analyzing {filename}")
+        job = job_store.get(e.job_id)
+        return {
+            "status": job["status"] if job else "queued",
+            "deduplicated": True,
+            "job_id": e.job_id,
+            "status_url": f"/jobs/{e.job_id}",
+            "query": query,
+            "file_processed": filename,
+            "file_size_bytes": ingested.size,
+            "document_sha256": ingested.sha256,
+            "message": "An identical analysis is already in progress; poll the status URL for its result"
         }
+    
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
         
     except Exception as e:
         # Log the error for debugging
-        print(f"Error processing document: {str(e)}")
+        print(f"Error queueing document: {str(e)}")
         raise HTTPException(
             status_code=500, 
             detail=f"Error processing financial document: {str(e)}"
         )
     
     finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                print(f"Cleaned up temporary file: {file_path}")
-            except Exception as cleanup_error:
-                print(f"Warning: Could not delete temporary file: {cleanup_error}")
+        # The job releases the document itself once queued
+        if not queued and document is not None:
+            release_document(document)
+
+@app.post("/analyze", status_code=202)
+async def analyze_document_endpoint(
+    file: UploadFile = File(..., description="Financial document PDF file"),
+    query: str = Form(
+        default="Provide a comprehensive financial analysis and investment recommendation",
+        description="Your analysis question or request"
+    ),
+    refresh: bool = Form(default=False, description="Re-run even if this document and query were analyzed before"),
+    base_document: str = Form(default=None, description="SHA-256 of an earlier version of this document")
+):
+    """Queue a financial document for analysis and return a job id immediately
+    
+    A document already analyzed for an equivalent query is answered from the result
+    store straight away (200 with the stored analysis) unless ``refresh`` is set. A
+    revised version of an analyzed document (``base_document``, or found by shared
+    pages) only re-runs the tasks its changed pages affect. While the same document
+    and query are already being analyzed (by any worker), the response points at
+    that job instead of starting another (``deduplicated``).
+    
+    The queued job:
+    1. Verifies the document is a valid financial report
+    2. Performs detailed financial analysis
+    3. Provides investment recommendations
+    4. Conducts risk assessment
+    
+    Args:
+        file: PDF file containing financial document (10-K, 10-Q, earnings report, etc.)
+        query: Your specific analysis question or investment objective
+        refresh: Ignore any stored analysis and run the crew again
+        base_document: SHA-256 of the earlier version this document revises
+        
+    Returns:
+        Job id and status URL; poll GET /jobs/{job_id} for progress and the analysis
+    """
+    summary = await queue_upload(file, query, refresh=refresh, base_document=base_document)
+    if summary.get("cached"):
+        return JSONResponse(summary, status_code=200)
+    return summary
+
+def format_sse(event: str, payload: dict) -> str:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+async def wait_for_job(job_id: str) -> tuple:
+    """Poll the shared job store until a job (possibly run by another worker) finishes
+
+    Returns:
+        tuple[str, dict]: ("complete", result) or ("error", {"detail": ...})
+    """
+    while True:
+        job = await asyncio.to_thread(job_store.get, job_id)
+        if job is None:
+            return "error", {"detail": f"Unknown job id: {job_id}"}
+        if job["status"] == COMPLETED:
+            return "complete", job["result"]
+        if job["status"] == FAILED:
+            return "error", {"detail": job["error"]}
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+@app.post("/analyze/stream")
+async def analyze_document_stream_endpoint(
+    file: UploadFile = File(..., description="Financial document PDF file"),
+    query: str = Form(
+        default="Provide a comprehensive financial analysis and investment recommendation",
+        description="Your analysis question or request"
+    ),
+    refresh: bool = Form(default=False, description="Re-run even if this document and query were analyzed before"),
+    base_document: str = Form(default=None, description="SHA-256 of an earlier version of this document")
+):
+    """Analyze a financial document and stream each task's output as soon as it completes
+    
+    Emits server-sent events: ``queued`` once the job is accepted, ``progress`` for
+    intermediate agent steps, ``task`` with each task's output (verification first),
+    then ``complete`` with the final result or ``error``. A stored analysis is
+    replayed as its ``task`` events followed by ``complete``. A request joining an
+    identical analysis already in progress gets ``queued`` and then only its
+    ``complete`` or ``error``.
+    
+    Args:
+        file: PDF file containing financial document (10-K, 10-Q, earnings report, etc.)
+        query: Your specific analysis question or investment objective
+        refresh: Ignore any stored analysis and run the crew again
+        base_document: SHA-256 of the earlier version this document revises
+        
+    Returns:
+        text/event-stream response
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def observer(event: str, payload: dict):
+        # Called on the job worker thread; hand the event over to the event loop
+        loop.call_soon_threadsafe(events.put_nowait, (event, payload))
+
+    queued = await queue_upload(file, query, observer, refresh=refresh, base_document=base_document)
+
+    async def event_stream():
+        if queued.get("cached"):
+            tasks = queued["tasks"]
+            for index, task_output in enumerate(tasks, start=1):
+                yield format_sse("task", {"index": index, "total": len(tasks), **task_output})
+            yield format_sse("complete", {
+                "analysis": queued["analysis"],
+                "analysis_id": queued["analysis_id"],
+                "analysis_url": queued["analysis_url"],
+                "cached": True
+            })
+            return
+        yield format_sse("queued", queued)
+        if queued.get("deduplicated"):
+            # Another request's job produces the result, so there are no step or task events
+            yield format_sse(*await wait_for_job(queued["job_id"]))
+            return
+        while True:
+            event, payload = await events.get()
+            yield format_sse(event, payload)
+            if event in ("complete", "error"):
+                break
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/analyze/batch")
+async def analyze_batch_endpoint(
+    files: List[UploadFile] = File(default=None, description="Financial document PDF files"),
+    directory: str = Form(default=None, description="Directory of PDFs on the server, relative to BATCH_ROOT"),
+    query: str = Form(
+        default="Provide a comprehensive financial analysis and investment recommendation",
+        description="Analysis question asked of every document"
+    ),
+    concurrency: int = Form(default=BATCH_CONCURRENCY, description="Documents analyzed at the same time"),
+    refresh: bool = Form(default=False, description="Re-analyze documents that have stored results")
+):
+    """Analyze many financial documents in one call and stream one NDJSON record per document
+    
+    Documents are extracted in parallel across processes, and up to ``concurrency``
+    crews run at once with their LLM calls under the shared rate limiter. Each line is
+    a ``result`` record (in completion order) and the last line is a ``summary``.
+    
+    Args:
+        files: PDF files to analyze
+        directory: Alternatively (or additionally) a directory of PDFs under BATCH_ROOT
+        query: Your specific analysis question or investment objective
+        concurrency: Number of documents analyzed at the same time
+        refresh: Ignore stored analyses and run every document again
+        
+    Returns:
+        application/x-ndjson response
+    """
+    if not files and not directory:
+        raise HTTPException(status_code=400, detail="Upload files or name a directory to analyze")
+    if not query or query.strip() == "":
+        query = "Provide a comprehensive financial analysis and investment recommendation"
+    query = query.strip()
+
+    documents = []
+    registered = []
+    try:
+        for file in files or []:
+            if not file.filename.endswith('.pdf'):
+                raise HTTPException(status_code=400, detail=f"Only PDF files are supported: {file.filename}")
+            with stage("upload_ingest") as span:
+                ingested = await ingest_upload(file)
+                span["bytes"] = ingested.size
+            if ingested.size == 0:
+                ingested.close()
+                raise HTTPException(status_code=400, detail=f"Uploaded file is empty: {file.filename}")
+            document = register_document(ingested)
+            registered.append(document)
+            documents.append((file.filename, document))
+
+        if directory:
+            root = os.path.realpath(BATCH_ROOT)
+            target = os.path.realpath(os.path.join(root, directory))
+            if os.path.commonpath([root, target]) != root or not os.path.isdir(target):
+                raise HTTPException(status_code=400, detail=f"Not a directory under {BATCH_ROOT}: {directory}")
+            documents.extend((os.path.relpath(path, root), path) for path in discover_documents([target]))
+        if not documents:
+            raise HTTPException(status_code=400, detail="No PDF documents to analyze")
+    except UploadTooLargeError as e:
+        for document in registered:
+            release_document(document)
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        for document in registered:
+            release_document(document)
+        raise
+
+    print(f"Batch of {len(documents)} documents, query: {query}")
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+
+    def produce():
+        # Runs the batch off the event loop and hands each record over as an NDJSON line
+        try:
+            records = analyze_batch(
+                documents, query, run_crew, concurrency, store=result_store, refresh=refresh, jobs=job_queue
+            )
+            for record in records:
+                loop.call_soon_threadsafe(lines.put_nowait, json.dumps(record) + "\n")
+        except Exception as e:
+            loop.call_soon_threadsafe(lines.put_nowait, json.dumps({"event": "error", "detail": str(e)}) + "\n")
+        finally:
+            for document in registered:
+                release_document(document)
+            loop.call_soon_threadsafe(lines.put_nowait, None)
+
+    threading.Thread(target=produce, name="batch", daemon=True).start()
+
+    async def line_stream():
+        while True:
+            line = await lines.get()
+            if line is None:
+                break
+            yield line
+
+    return StreamingResponse(line_stream(), media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the status, progress and (once finished) result of a queued analysis"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return job
+
+@app.get("/analyses")
+async def list_analyses(
+    document_sha256: str = None,
+    query: str = None,
+    filename: str = None,
+    since: float = None,
+    until: float = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    """Search stored analyses, newest first
+    
+    Args:
+        document_sha256: Only analyses of this document
+        query: Only analyses whose (normalized) query contains this text
+        filename: Only analyses of files whose name contains this text
+        since: Only analyses created at or after this Unix time
+        until: Only analyses created before this Unix time
+        limit: Page size (1-100)
+        offset: Number of matches to skip
+        
+    Returns:
+        Matching analyses without their payloads, plus the total match count
+    """
+    return result_store.search(document_sha256, query, filename, since, until, limit, offset)
+
+@app.get("/analyses/{analysis_id}")
+async def get_analysis(analysis_id: str):
+    """A stored analysis with its final output and the structured output of every task"""
+    analysis = result_store.get(analysis_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail=f"Unknown analysis id: {analysis_id}")
+    return analysis
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Per-stage latency histograms and token counters in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Per-request trace: every recorded stage with its timing, tokens and memory high-water mark"""
+    trace = load_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace id: {trace_id}")
+    return trace
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    if workers > 1:
+        # Worker processes share the SQLite stores and caches; the LLM quota must be shared too
+        from cache import CACHE_DIR
+        os.environ.setdefault("LLM_RATE_LIMIT_FILE", os.path.join(CACHE_DIR, "ratelimit.json"))
+    # Reloading runs a file watcher and re-imports the app on every change: development only
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("UVICORN_HOST", "127.0.0.1"),
+        port=int(os.getenv("UVICORN_PORT", "8000")),
+        workers=workers,
+        reload=os.getenv("UVICORN_RELOAD", "false").lower() in ("1", "true", "yes"),
+        # Open connections (e.g. event streams) get this long before the job queue drains
+        timeout_graceful_shutdown=int(SHUTDOWN_GRACE_SECONDS)
+    )
\ No newline at end of file
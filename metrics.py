@@ -0,0 +1,250 @@
+## Importing libraries and files
+import contextvars
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+## Metrics configuration (overridable through environment variables)
+TRACE_DIR = os.getenv("TRACE_DIR", "outputs/traces")
+# Only the most recent traces are kept on disk
+TRACE_RETENTION = int(os.getenv("TRACE_RETENTION", "1000"))
+
+# Histogram bucket upper bounds in seconds, from a single PDF page up to a full crew run
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text (about four characters per token)
+
+    Good enough for relative comparisons without a provider-specific tokenizer.
+    """
+    return math.ceil(len(text or "") / 4)
+
+
+def max_rss_bytes() -> int:
+    """Process resident-set high-water mark in bytes"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes() -> int:
+    """Current process resident set size in bytes (None where /proc is not available)"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+## Prometheus-style registry
+class MetricsRegistry:
+    """Process-wide histograms and counters rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (stage, labels) -> [bucket counts..., sum, count]
+        self._counters = {}    # (name, labels) -> value
+
+    def observe(self, stage: str, seconds: float, labels: tuple = ()):
+        key = (stage, labels)
+        with self._lock:
+            entry = self._histograms.setdefault(key, [0] * len(DURATION_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    entry[i] += 1
+            entry[-2] += seconds
+            entry[-1] += 1
+
+    def increment(self, name: str, amount: float = 1, labels: tuple = ()):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        def label_text(pairs):
+            escaped = (
+                (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for name, value in pairs
+            )
+            return ",".join(f'{name}="{value}"' for name, value in escaped)
+
+        lines = [
+            "# HELP fda_stage_duration_seconds Duration of pipeline stages",
+            "# TYPE fda_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for (stage, labels), entry in histograms:
+            base = label_text((("stage", stage),) + labels)
+            for bound, count in zip(DURATION_BUCKETS, entry):
+                lines.append(f'fda_stage_duration_seconds_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'fda_stage_duration_seconds_bucket{{{base},le="+Inf"}} {entry[-1]}')
+            lines.append(f"fda_stage_duration_seconds_sum{{{base}}} {entry[-2]}")
+            lines.append(f"fda_stage_duration_seconds_count{{{base}}} {entry[-1]}")
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{{{label_text(labels)}}} {value}" if labels else f"{name} {value}")
+
+        lines.append("# TYPE fda_process_max_rss_bytes gauge")
+        lines.append(f"fda_process_max_rss_bytes {max_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+## Per-request traces
+class Trace:
+    """Ordered record of the stages one request went through"""
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or str(uuid.uuid4())
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "started": self.started,
+            "duration_seconds": time.time() - self.started,
+            "prompt_tokens": sum(span.get("prompt_tokens", 0) for span in spans),
+            "completion_tokens": sum(span.get("completion_tokens", 0) for span in spans),
+            # True when some of the counts above are chars/4 estimates rather than provider usage
+            "tokens_estimated": any(span.get("tokens_estimated") for span in spans),
+            "spans": spans,
+        }
+
+    def save(self, directory: str = TRACE_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.trace_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        prune_traces(directory)
+        return path
+
+
+def prune_traces(directory: str = TRACE_DIR, keep: int = TRACE_RETENTION):
+    """Delete all but the `keep` most recently written traces"""
+    with os.scandir(directory) as entries:
+        traces = [entry for entry in entries if entry.name.endswith(".json")]
+    if len(traces) <= keep:
+        return
+    try:
+        traces.sort(key=lambda entry: entry.stat().st_mtime)
+    except FileNotFoundError:
+        return  # a concurrent save is pruning; it will finish the job
+    for entry in traces[:len(traces) - keep]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass  # another request pruned it first
+
+
+def start_trace(trace_id: str = None) -> Trace:
+    """Create a trace and make it current for this context (thread or task)"""
+    trace = Trace(trace_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def activate_trace(trace: Trace):
+    """Make an existing trace current, e.g. on the worker thread that continues a request"""
+    _current_trace.set(trace)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def load_trace(trace_id: str, directory: str = TRACE_DIR):
+    path = os.path.join(directory, f"{os.path.basename(trace_id)}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+## Recording
+def record(stage: str, seconds: float, started: float = None, **attributes):
+    """Record a finished stage in the registry and in the current trace
+
+    Args:
+        stage: Stage name, e.g. "llm_call"
+        seconds: Stage duration
+        started: Wall-clock start time (defaults to now minus seconds)
+        **attributes: Span attributes; string-valued ones also become metric labels,
+            prompt_tokens/completion_tokens also feed the token counters (labelled
+            source="estimate" when tokens_estimated is set)
+    """
+    labels = tuple(sorted((k, v) for k, v in attributes.items() if isinstance(v, str)))
+    registry.observe(stage, seconds, labels)
+    source = "estimate" if attributes.get("tokens_estimated") else "provider"
+    for kind in ("prompt", "completion"):
+        tokens = attributes.get(f"{kind}_tokens")
+        if tokens:
+            registry.increment(
+                "fda_llm_tokens_total", tokens, (("kind", kind), ("source", source), ("stage", stage))
+            )
+
+    trace = current_trace()
+    if trace is not None:
+        trace.add({
+            "stage": stage,
+            "start": started if started is not None else time.time() - seconds,
+            "duration_seconds": seconds,
+            "rss_bytes": current_rss_bytes(),
+            **attributes,
+        })
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Time a block and record it as a stage
+
+    The yielded dict can be filled in by the block with attributes known only at
+    the end (e.g. completion token counts). The span also gets rss_delta_bytes, the
+    change in resident memory across the block; it is process-wide, so stages
+    running concurrently on other threads contribute to it.
+
+    Usage:
+        with stage("llm_call", model=model) as span:
+            ...
+            span["completion_tokens"] = n
+    """
+    span = dict(attributes)
+    started = time.time()
+    start = time.perf_counter()
+    rss_start = current_rss_bytes()
+    try:
+        yield span
+    except Exception:
+        span["error"] = "true"
+        raise
+    finally:
+        if rss_start is not None:
+            span["rss_delta_bytes"] = current_rss_bytes() - rss_start
+        record(name, time.perf_counter() - start, started=started, **span)
@@ -0,0 +1,194 @@
+## Importing libraries and files
+import hashlib
+import os
+import shutil
+import threading
+import time
+import zlib
+
+from cache import CACHE_DIR, DiskCache
+from metrics import record, registry, stage
+
+try:
+    import pytesseract
+except ImportError:  # OCR is optional: scanned pages then stay empty
+    pytesseract = None
+
+## OCR configuration (overridable through environment variables)
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() not in ("0", "false", "no")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+# Render resolution; Tesseract is most accurate at around 300 DPI
+OCR_RESOLUTION = int(os.getenv("OCR_RESOLUTION", "300"))
+OCR_CACHE_BYTES = int(os.getenv("OCR_CACHE_BYTES", str(256 * 1024 * 1024)))
+# Consecutive scanned pages the streaming API collects before sending them to the pool together
+OCR_STREAM_BATCH = int(os.getenv("OCR_STREAM_BATCH", str(max(1, OCR_WORKERS) * 2)))
+
+_store = None
+_store_lock = threading.Lock()
+_warned = False
+
+
+def ocr_available() -> bool:
+    """True when pytesseract is installed and the tesseract binary is on the PATH"""
+    global _warned
+    available = pytesseract is not None and shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+    if not available and not _warned:
+        _warned = True
+        print("OCR unavailable (install pytesseract and tesseract); scanned pages will have no text")
+    return available
+
+
+def _get_store() -> DiskCache:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DiskCache(os.path.join(CACHE_DIR, "ocr.sqlite"), OCR_CACHE_BYTES)
+        return _store
+
+
+def _page_key(page) -> str:
+    """Hash of what a scanned page shows: its size and the raw bytes of its images
+
+    Identical scans hash alike across documents (e.g. a re-filed exhibit), without
+    decoding or rendering anything.
+    """
+    digest = hashlib.sha256(f"{page.width:.1f}x{page.height:.1f}".encode())
+    for image in page.images:
+        digest.update(image["stream"].get_rawdata() or b"")
+    digest.update(f"|{OCR_LANGUAGE}|{OCR_RESOLUTION}".encode())
+    return digest.hexdigest()
+
+
+def _scanned_pages(source, page_numbers: list) -> dict:
+    """Page number -> page key for the given text-less pages that contain images (blank pages have none)"""
+    from extraction import open_pdf  # extraction imports this module
+
+    scanned = {}
+    with open_pdf(source, pages=page_numbers) as pdf:
+        for page_number, page in zip(page_numbers, pdf.pages):
+            try:
+                if page.images:
+                    scanned[page_number] = _page_key(page)
+            finally:
+                page.close()
+    return scanned
+
+
+def _recognize_pages(source, page_numbers: list, resolution: int, language: str) -> list:
+    """Render and OCR pages of a PDF (runs inside pool workers)
+
+    A page that fails to render or recognize does not fail the others.
+
+    Returns:
+        list[tuple[int, str, float, str]]: (page number, text, seconds, error) per
+            page; error is None on success, and text is "" when it is set
+    """
+    from extraction import open_pdf  # extraction imports this module
+
+    results = []
+    with open_pdf(source, pages=page_numbers) as pdf:
+        for page_number, page in zip(page_numbers, pdf.pages):
+            started = time.perf_counter()
+            text, error = "", None
+            try:
+                image = page.to_image(resolution=resolution).original
+                text = pytesseract.image_to_string(image, lang=language).strip()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                page.close()
+            results.append((page_number, text, time.perf_counter() - started, error))
+    return results
+
+
+def _collect(future, group: list) -> list:
+    """Results of one pool task; every page of the group fails if the task itself did"""
+    try:
+        return future.result()
+    except Exception as e:
+        return [(page_number, "", 0.0, f"{type(e).__name__}: {e}") for page_number in group]
+
+
+def _recognize(source, page_numbers: list, workers: int) -> dict:
+    """Page number -> OCR text for the scanned pages among page_numbers, from the cache or the pool"""
+    recognized = {}
+    with stage("ocr") as span:
+        scanned = _scanned_pages(source, page_numbers)
+        store = _get_store()
+        missing = {}  # page key -> first page showing it; repeated scans are recognized once
+        for page_number, key in scanned.items():
+            cached = store.get(key)
+            if cached is not None:
+                recognized[page_number] = zlib.decompress(cached).decode("utf-8")
+            elif key not in missing:
+                missing[key] = page_number
+        registry.increment("fda_ocr_pages_total", len(scanned) - len(missing), (("cache", "hit"),))
+        registry.increment("fda_ocr_pages_total", len(missing), (("cache", "miss"),))
+
+        if missing:
+            # In-memory documents are pickled to the workers, so send one group each
+            payload = source if isinstance(source, str) else bytes(source)
+            unique = list(missing.values())
+            group_count = min(len(unique), max(1, workers))
+            groups = [unique[i::group_count] for i in range(group_count)]
+            from extraction import process_pool  # extraction imports this module
+
+            # Separate from the extraction pool: OCR tasks run for seconds and would starve it
+            pool = process_pool("ocr", max(1, workers))
+            futures = [
+                pool.submit(_recognize_pages, payload, group, OCR_RESOLUTION, OCR_LANGUAGE) for group in groups
+            ]
+            failed = 0
+            for future, group in zip(futures, groups):
+                for page_number, text, seconds, error in _collect(future, group):
+                    recognized[page_number] = text
+                    record("ocr_page", seconds, page=page_number)
+                    if error is not None:
+                        # Not cached, so the page is tried again next time
+                        failed += 1
+                        print(f"OCR of page {page_number} failed: {error}")
+                        continue
+                    store.put(scanned[page_number], zlib.compress(text.encode("utf-8")))
+            registry.increment("fda_ocr_failures_total", failed)
+            span["failed_pages"] = failed
+            for page_number, key in scanned.items():
+                if page_number not in recognized:
+                    recognized[page_number] = recognized[missing[key]]
+        span["scanned_pages"] = len(scanned)
+        span["recognized_pages"] = len(missing)
+    return recognized
+
+
+def ocr_pages(source, pages: list, workers: int = None) -> list:
+    """Fill in the text of scanned pages with OCR
+
+    Only pages without extractable text that contain images are rendered and
+    recognized, so the cost grows with the number of scanned pages rather than
+    the page count. Results are cached by page hash.
+
+    Args:
+        source: Path of the pdf file, or its bytes
+        pages: Extracted text of each page, in page order
+        workers: Number of OCR processes (defaults to OCR_WORKERS)
+
+    Returns:
+        list[str]: The page texts, with recognized text for scanned pages
+    """
+    empty = [number for number, text in enumerate(pages, start=1) if not text.strip()]
+    if not empty or not OCR_ENABLED or not ocr_available():
+        return pages
+    recognized = _recognize(source, empty, OCR_WORKERS if workers is None else workers)
+    return [recognized.get(number, text) for number, text in enumerate(pages, start=1)]
+
+
+def ocr_page_texts(source, page_numbers: list) -> dict:
+    """Page number -> OCR text for the scanned pages among pages without extractable text
+
+    Pages are recognized together across the pool. As in ocr_pages(), pages
+    without images, and every page when OCR is unavailable, are left out so the
+    caller keeps their extracted text; a page whose OCR failed maps to "".
+    """
+    if not page_numbers or not OCR_ENABLED or not ocr_available():
+        return {}
+    return _recognize(source, page_numbers, OCR_WORKERS)
@@ -0,0 +1,289 @@
+## Importing libraries and files
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from crewai import Crew, Process
+from crewai.crews.crew_output import CrewOutput
+from crewai.tasks.task_output import TaskOutput
+from crewai.types.usage_metrics import UsageMetrics
+
+from compaction import COMPACTION_ENABLED, compact_output, record_context
+from metrics import record, stage
+
+## Pipeline configuration (overridable through environment variables)
+# dag: tasks whose context is satisfied run concurrently; sequential: one Crew, one task at a time
+CREW_EXECUTION_MODE = os.getenv("CREW_EXECUTION_MODE", "dag")
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "4"))
+
+EXECUTION_MODES = ("dag", "sequential")
+
+
+class PipelineStopped(Exception):
+    """Raised from the task callback to end a sequential Crew early (see run_sequential)"""
+
+
+def dependency_levels(tasks: list) -> list:
+    """Group tasks into levels whose members only depend on tasks in earlier levels
+
+    Args:
+        tasks: Tasks in declaration order; context edges must point backwards
+
+    Returns:
+        list[list[Task]]: Levels in execution order, tasks within a level in declaration order
+    """
+    level_of = {}
+    for task in tasks:
+        context = task.context if isinstance(task.context, list) else []
+        parents = [context_task for context_task in context if id(context_task) in level_of]
+        level_of[id(task)] = 1 + max((level_of[id(parent)] for parent in parents), default=-1)
+    levels = [[] for _ in range(max(level_of.values(), default=-1) + 1)]
+    for task in tasks:
+        levels[level_of[id(task)]].append(task)
+    return levels
+
+
+def copy_tasks(tasks: list) -> list:
+    """Copy tasks and their agents so concurrent runs never share outputs or interpolated prompts
+
+    Context edges are remapped onto the copies. The templates passed in should never
+    be kicked off themselves, so their descriptions keep the {placeholders}.
+
+    Args:
+        tasks: Template tasks in declaration order
+
+    Returns:
+        list[Task]: Fresh copies in the same order
+    """
+    agents = {}
+    task_mapping = {}
+    copies = []
+    for task in tasks:
+        if id(task.agent) not in agents:
+            agents[id(task.agent)] = task.agent.copy()
+        copied = task.copy(list(agents.values()), task_mapping)
+        task_mapping[task.key] = copied
+        copies.append(copied)
+    return copies
+
+
+class CrewTemplate:
+    """Template tasks plus a pool of ready-to-run copies
+
+    A copy is checked out for one run at a time and returned afterwards, so a
+    worker pays for copying the tasks and agents once instead of on every run.
+    """
+
+    def __init__(self, tasks: list, max_idle: int = PIPELINE_MAX_WORKERS):
+        self.tasks = tasks
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def fill(self, count: int):
+        """Copy the template ahead of time until count copies are idle"""
+        while True:
+            with self._lock:
+                if len(self._idle) >= min(count, self.max_idle):
+                    return
+            copied = copy_tasks(self.tasks)
+            with self._lock:
+                self._idle.append(copied)
+
+    @contextmanager
+    def checkout(self):
+        """An idle copy of the tasks (or a fresh one), cleared of its previous run's outputs"""
+        with self._lock:
+            tasks = self._idle.pop() if self._idle else None
+        if tasks is None:
+            tasks = copy_tasks(self.tasks)
+        for task in tasks:
+            task.output = None
+        try:
+            yield tasks
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(tasks)
+
+
+def _reset_callbacks(tasks: list):
+    # Crew copies its task_callback onto tasks that have none and never clears it,
+    # so a callback from an earlier run would otherwise keep firing on these shared tasks
+    for task in tasks:
+        task.callback = None
+
+
+def _apply_precomputed(tasks: list, inputs: dict, precomputed: dict, task_callback=None) -> list:
+    """Give tasks with a precomputed output (by task name) that output instead of running them
+
+    Returns:
+        list[Task]: The tasks that still have to run
+    """
+    remaining = []
+    for task in tasks:
+        if task.name not in (precomputed or {}):
+            remaining.append(task)
+            continue
+        # Interpolate as a run would, so downstream tasks see the same description
+        task.interpolate_inputs_and_add_conversation_history(inputs)
+        task.output = TaskOutput(
+            name=task.name,
+            description=task.description,
+            expected_output=task.expected_output,
+            raw=precomputed[task.name],
+            agent=task.agent.role,
+        )
+        if task_callback:
+            task_callback(task.output)
+    return remaining
+
+
+def _compact_finished(tasks: list, full_outputs: dict):
+    """Swap finished tasks' outputs for compact summaries, which is what downstream tasks read as context
+
+    The full outputs are kept in full_outputs (by task id) and put back by _restore_outputs.
+    """
+    if not COMPACTION_ENABLED:
+        return
+    for task in tasks:
+        if task.output is not None and id(task) not in full_outputs:
+            full_outputs[id(task)] = task.output
+            task.output = compact_output(task.output)
+
+
+def _restore_outputs(tasks: list, full_outputs: dict):
+    for task in tasks:
+        if id(task) in full_outputs:
+            task.output = full_outputs.pop(id(task))
+
+
+def _run_task(task, inputs: dict, task_callback=None, step_callback=None) -> CrewOutput:
+    # Each task gets its own single-agent Crew, so concurrently running tasks never
+    # share an agent executor. Context from earlier levels is read off task.context.
+    crew = Crew(
+        agents=[task.agent],
+        tasks=[task],
+        process=Process.sequential,
+        verbose=True,
+        task_callback=task_callback,
+        step_callback=step_callback
+    )
+    with stage("crew_task", task=task.agent.role):
+        return crew.kickoff(inputs)
+
+
+def _stopped(tasks: list, stop_when) -> bool:
+    return stop_when is not None and any(task.output is not None and stop_when(task.output) for task in tasks)
+
+
+def run_dag(tasks: list, inputs: dict, task_callback=None, step_callback=None,
+            max_workers: int = PIPELINE_MAX_WORKERS, precomputed: dict = None, stop_when=None) -> CrewOutput:
+    """Run tasks level by level, executing independent tasks of a level concurrently
+
+    Results are merged in declaration order, so the output does not depend on which
+    concurrent task finished first.
+
+    Args:
+        tasks: Tasks in declaration order
+        inputs: Crew kickoff inputs (e.g. {"query": ...})
+        task_callback: Optional callable invoked with each TaskOutput as its task completes
+        step_callback: Optional callable invoked with each intermediate agent step
+        max_workers: Upper bound on tasks running at the same time
+        precomputed: Task name -> output text of tasks that are not run again (e.g.
+            reused from the analysis of an earlier document version)
+        stop_when: Optional callable(TaskOutput) -> bool; once it is true for a finished
+            task, the levels not yet started are skipped (e.g. a rejected document)
+
+    Returns:
+        CrewOutput: Combined output; raw is the last finished task's output
+    """
+    _reset_callbacks(tasks)
+    remaining = _apply_precomputed(tasks, inputs, precomputed, task_callback)
+    token_usage = UsageMetrics()
+    full_outputs = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crew-task") as executor:
+            for level in dependency_levels(remaining):
+                if _stopped(tasks, stop_when):
+                    break
+                _compact_finished(tasks, full_outputs)
+                # Copy the context so metrics land in the caller's request trace
+                futures = [
+                    executor.submit(contextvars.copy_context().run, _run_task, task, inputs, task_callback, step_callback)
+                    for task in level
+                ]
+                for future in futures:
+                    token_usage.add_usage_metrics(future.result().token_usage)
+                for task in level:
+                    record_context(task, full_outputs)
+    finally:
+        _restore_outputs(tasks, full_outputs)
+
+    return _combined_output(tasks, token_usage)
+
+
+def run_sequential(agents: list, tasks: list, inputs: dict, task_callback=None, step_callback=None,
+                   precomputed: dict = None, stop_when=None) -> CrewOutput:
+    """Run all tasks in one Crew with Process.sequential
+
+    Tasks named in precomputed (name -> output text) are not run again. Once
+    stop_when(TaskOutput) is true for a finished task, the rest are skipped.
+    """
+    _reset_callbacks(tasks)
+    remaining = _apply_precomputed(tasks, inputs, precomputed, task_callback)
+    if _stopped(tasks, stop_when):
+        remaining = []
+    if len(remaining) < len(tasks):
+        if not remaining:
+            return _combined_output(tasks, UsageMetrics())
+        agents = [agent for agent in agents if any(task.agent is agent for task in remaining)]
+    last_finished = time.perf_counter()
+    full_outputs = {}
+    _compact_finished(tasks, full_outputs)
+
+    def on_task_complete(output):
+        # Tasks run back to back, so each one's duration is the time since the previous finished
+        nonlocal last_finished
+        now = time.perf_counter()
+        record("crew_task", now - last_finished, task=output.agent)
+        last_finished = now
+        finished = [task for task in remaining if task.output is output]
+        for task in finished:
+            record_context(task, full_outputs)
+        if task_callback:
+            task_callback(output)
+        if stop_when is not None and stop_when(output):
+            # Crew has no early exit: abort the kickoff; finished outputs stay on their tasks
+            raise PipelineStopped(output.name)
+        # The Crew keeps the full output for its result; later tasks read the summary
+        _compact_finished(finished, full_outputs)
+
+    crew = Crew(
+        agents=agents,
+        tasks=remaining,
+        process=Process.sequential,
+        verbose=True,
+        task_callback=on_task_complete,
+        step_callback=step_callback
+    )
+    try:
+        output = crew.kickoff(inputs)
+    except PipelineStopped:
+        output = None
+    finally:
+        _restore_outputs(tasks, full_outputs)
+    if output is None:
+        return _combined_output(tasks, crew.calculate_usage_metrics())
+    if len(remaining) < len(tasks):
+        return _combined_output(tasks, output.token_usage)
+    return output
+
+
+def _combined_output(tasks: list, token_usage: UsageMetrics) -> CrewOutput:
+    # Tasks skipped after an early stop have no output
+    tasks_output = [task.output for task in tasks if task.output is not None]
+    return CrewOutput(raw=tasks_output[-1].raw, tasks_output=tasks_output, token_usage=token_usage)
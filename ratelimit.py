@@ -0,0 +1,253 @@
+## Importing libraries and files
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+try:
+    import fcntl
+except ImportError:  # Windows: the budget stays per process
+    fcntl = None
+
+## Rate-limit configuration (overridable through environment variables)
+# Provider quota shared by every crew in this process (0 disables a limit)
+LLM_RPM = float(os.getenv("LLM_RPM", "20"))
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+# Upper bound on LLM requests in flight at the same time in this process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# When set, the quota is shared by every worker process that points at this file
+LLM_RATE_LIMIT_FILE = os.getenv("LLM_RATE_LIMIT_FILE", "")
+# Retries of a request the provider rejected with 429, with exponential backoff between them
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "2"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+
+WINDOW_SECONDS = 60.0
+# Longest a waiter sleeps before re-reading a budget that other processes may have changed
+_POLL_SECONDS = 1.0
+
+# Lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Run the block's LLM requests at the given priority (INTERACTIVE or BATCH)"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether a provider error is an HTTP 429 (quota exceeded)"""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error: Exception):
+    """The Retry-After the provider sent with a 429, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+## Quota accounting
+class MinuteBudget:
+    """Requests and tokens admitted during the last minute, optionally shared through a file
+
+    A request is admitted only if the rolling one-minute window stays within both
+    quotas, so sustained throughput runs right at the quota without any window ever
+    exceeding it. With a state file, the window lives on disk under an fcntl lock
+    and every worker process draws from the same quota.
+    """
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, path: str = LLM_RATE_LIMIT_FILE):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.path = path if path and fcntl is not None else None
+        self._state = {"entries": deque(), "blocked_until": 0.0}
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    @contextmanager
+    def _transaction(self):
+        # Callers already hold the scheduler lock; the file lock covers other processes
+        if not self.path:
+            yield self._state
+            return
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {"entries": [], "blocked_until": 0.0}
+                state["entries"] = deque(state["entries"])
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump({"entries": list(state["entries"]), "blocked_until": state["blocked_until"]}, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reserve(self, tokens: float):
+        """Admit one request of `tokens` tokens if the window allows it
+
+        Returns:
+            tuple: (entry id, 0.0) when admitted, or (None, seconds until it may fit)
+        """
+        if self.tpm:
+            # A request larger than the whole quota could never fit; let it use all of it
+            tokens = min(tokens, self.tpm)
+        now = time.time()
+        with self._transaction() as state:
+            entries = state["entries"]
+            while entries and entries[0][0] <= now - WINDOW_SECONDS:
+                entries.popleft()
+            if state["blocked_until"] > now:
+                return None, state["blocked_until"] - now
+
+            wait = 0.0
+            if self.rpm and len(entries) + 1 > self.rpm:
+                # The request fits once enough of the oldest requests leave the window
+                wait = entries[len(entries) - int(self.rpm)][0] + WINDOW_SECONDS - now
+            if self.tpm:
+                excess = sum(entry[1] for entry in entries) + tokens - self.tpm
+                for timestamp, entry_tokens, _ in entries:
+                    if excess <= 0:
+                        break
+                    excess -= entry_tokens
+                    wait = max(wait, timestamp + WINDOW_SECONDS - now)
+            if wait > 0:
+                return None, wait
+
+            entry_id = uuid.uuid4().hex
+            entries.append([now, tokens, entry_id])
+            return entry_id, 0.0
+
+    def settle(self, entry_id: str, tokens: float):
+        """Replace a reservation's estimated token count with the tokens actually used"""
+        with self._transaction() as state:
+            for entry in state["entries"]:
+                if entry[2] == entry_id:
+                    entry[1] = tokens
+                    break
+
+    def block(self, seconds: float):
+        """Admit nothing for the next `seconds` (the provider is throttling us)"""
+        with self._transaction() as state:
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+
+
+@dataclass
+class Reservation:
+    entry_id: str
+    tokens: float
+    waited: float
+
+
+## Scheduling
+class LLMScheduler:
+    """Admits LLM requests in priority order within the provider quota and a concurrency cap
+
+    Waiting requests form a priority queue: interactive requests go ahead of batch
+    requests, and requests of equal priority are served first come, first served.
+    """
+
+    def __init__(self, budget: MinuteBudget = None, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.budget = budget or MinuteBudget()
+        self.max_concurrency = max(1, max_concurrency)
+        self._condition = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._in_flight = 0
+
+    def acquire(self, tokens: float = 0, level: int = None) -> Reservation:
+        """Block until the request may be sent
+
+        Args:
+            tokens: Estimated prompt plus completion tokens of the request
+            level: Priority (defaults to the current priority() context)
+
+        Returns:
+            Reservation: To be passed to release() once the request finished
+        """
+        level = _priority.get() if level is None else level
+        ticket = (level, next(self._sequence))
+        start = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] != ticket or self._in_flight >= self.max_concurrency:
+                        self._condition.wait(_POLL_SECONDS if self.budget.path else None)
+                        continue
+                    entry_id, wait = self.budget.reserve(tokens)
+                    if entry_id is not None:
+                        break
+                    self._condition.wait(min(wait, _POLL_SECONDS) if self.budget.path else wait)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            # The next request in line may be admissible right away
+            self._condition.notify_all()
+        return Reservation(entry_id, tokens, time.monotonic() - start)
+
+    def release(self, reservation: Reservation):
+        """Free the request's concurrency slot and settle its token count"""
+        with self._condition:
+            if self.budget.tpm:
+                self.budget.settle(reservation.entry_id, reservation.tokens)
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def request(self, tokens: float = 0):
+        """Hold an admitted request for the duration of the block
+
+        Set the yielded reservation's ``tokens`` to the tokens actually used before
+        leaving the block, so the window accounts for them instead of the estimate.
+        """
+        reservation = self.acquire(tokens)
+        try:
+            yield reservation
+        finally:
+            self.release(reservation)
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Pause every request after a 429 and return how long to wait before retrying
+
+        Args:
+            attempt: Zero-based number of the retry about to happen
+            retry_after: Delay requested by the provider, if it sent one
+
+        Returns:
+            float: Seconds until the retry
+        """
+        delay = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_SECONDS * 2 ** attempt)
+        delay *= 0.5 + random.random() / 2  # jitter so throttled workers do not retry in lockstep
+        delay = max(delay, retry_after or 0.0)
+        with self._condition:
+            self.budget.block(delay)
+        return delay
+
+
+llm_scheduler = LLMScheduler()
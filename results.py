@@ -0,0 +1,227 @@
+## Importing libraries and files
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+import zlib
+
+from cache import SQLiteConnections
+
+## Result store configuration (overridable through environment variables)
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "data/results.sqlite")
+# Least recently used analyses beyond this count are deleted
+RESULTS_MAX_ENTRIES = int(os.getenv("RESULTS_MAX_ENTRIES", "10000"))
+
+MAX_PAGE_SIZE = 100
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query for lookups: lower case, single spaces, no trailing punctuation"""
+    return re.sub(r"\s+", " ", (query or "").lower()).strip().rstrip("?.!").strip()
+
+
+def task_outputs(response) -> list:
+    """Structured per-task outputs of a CrewOutput, in task order"""
+    return [
+        {
+            "name": output.name,
+            "agent": output.agent,
+            "summary": output.summary,
+            "output": output.raw,
+        }
+        for output in response.tasks_output
+    ]
+
+
+## Analysis persistence
+class ResultStore:
+    """SQLite store of finished analyses keyed by document hash and normalized query
+
+    Metadata lives in indexed columns for filtering; the analysis text and per-task
+    outputs are stored as a zlib-compressed JSON payload.
+    """
+
+    def __init__(self, path: str = RESULTS_DB_PATH, max_entries: int = RESULTS_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._connect = SQLiteConnections(path, row_factory=sqlite3.Row)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "id TEXT PRIMARY KEY, document_sha256 TEXT NOT NULL, query_key TEXT NOT NULL, "
+                "query TEXT NOT NULL, filename TEXT, created REAL NOT NULL, accessed REAL NOT NULL, "
+                "hits INTEGER NOT NULL DEFAULT 0, payload BLOB NOT NULL, "
+                "UNIQUE (document_sha256, query_key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS analyses_accessed ON analyses (accessed)")
+            # Page fingerprints of analyzed documents, for finding and diffing earlier versions
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "sha256 TEXT PRIMARY KEY, filename TEXT, pages TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_index ("
+                "fingerprint TEXT NOT NULL, document_sha256 TEXT NOT NULL, "
+                "PRIMARY KEY (fingerprint, document_sha256))"
+            )
+
+    def save(self, document_sha256: str, query: str, filename: str, analysis: str, tasks: list,
+             revision: dict = None) -> str:
+        """Store (or replace) the analysis of a document for a query
+
+        Args:
+            document_sha256: SHA-256 of the document bytes
+            query: Query as asked; lookups match on its normalized form
+            filename: Name of the analyzed file, for display and filtering
+            analysis: Final crew output
+            tasks: Per-task outputs, see task_outputs()
+            revision: For an incremental re-analysis, the earlier version and what was re-run
+
+        Returns:
+            str: Analysis id
+        """
+        analysis_id = str(uuid.uuid4())
+        content = {"analysis": analysis, "tasks": tasks}
+        if revision is not None:
+            content["revision"] = revision
+        payload = zlib.compress(json.dumps(content).encode("utf-8"))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(id, document_sha256, query_key, query, filename, created, accessed, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (analysis_id, document_sha256, normalize_query(query), query, filename, now, now, payload),
+            )
+            evicted = conn.execute(
+                "DELETE FROM analyses WHERE id IN "
+                "(SELECT id FROM analyses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            if evicted:
+                # Fingerprints of documents with no analyses left (older than a day, so
+                # documents still being analyzed keep theirs)
+                conn.execute(
+                    "DELETE FROM documents WHERE created < ? AND sha256 NOT IN "
+                    "(SELECT document_sha256 FROM analyses)",
+                    (now - 24 * 3600,),
+                )
+                conn.execute("DELETE FROM page_index WHERE document_sha256 NOT IN (SELECT sha256 FROM documents)")
+        return analysis_id
+
+    def lookup(self, document_sha256: str, query: str):
+        """Find the stored analysis of a document for an equivalent query
+
+        Returns:
+            dict | None: Full analysis record (see get()), or None if never analyzed
+        """
+        row = self._connect().execute(
+            "SELECT * FROM analyses WHERE document_sha256 = ? AND query_key = ?",
+            (document_sha256, normalize_query(query)),
+        ).fetchone()
+        if row is None:
+            return None
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analyses SET hits = hits + 1, accessed = ? WHERE id = ?", (time.time(), row["id"])
+            )
+        return self._record(row)
+
+    def get(self, analysis_id: str):
+        row = self._connect().execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        return None if row is None else self._record(row)
+
+    def search(self, document_sha256: str = None, query: str = None, filename: str = None,
+               since: float = None, until: float = None, limit: int = 20, offset: int = 0) -> dict:
+        """List stored analyses, newest first, without their payloads
+
+        Args:
+            document_sha256: Only analyses of this document
+            query: Only analyses whose normalized query contains this text
+            filename: Only analyses of files whose name contains this text
+            since: Only analyses created at or after this Unix time
+            until: Only analyses created before this Unix time
+            limit: Page size (at most MAX_PAGE_SIZE)
+            offset: Number of matching analyses to skip
+
+        Returns:
+            dict: {"total", "limit", "offset", "items"}
+        """
+        conditions, parameters = [], []
+        if document_sha256:
+            conditions.append("document_sha256 = ?")
+            parameters.append(document_sha256)
+        if query:
+            conditions.append("instr(query_key, ?) > 0")
+            parameters.append(normalize_query(query))
+        if filename:
+            conditions.append("instr(lower(filename), ?) > 0")
+            parameters.append(filename.lower())
+        if since is not None:
+            conditions.append("created >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("created < ?")
+            parameters.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM analyses {where}", parameters).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT id, document_sha256, query, filename, created, accessed, hits FROM analyses {where} "
+            "ORDER BY created DESC LIMIT ? OFFSET ?",
+            (*parameters, limit, offset),
+        ).fetchall()
+        return {"total": total, "limit": limit, "offset": offset, "items": [dict(row) for row in rows]}
+
+    def save_pages(self, document_sha256: str, filename: str, pages: list):
+        """Remember a document's page fingerprints (see revisions.fingerprint_pages)"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, filename, pages, created) VALUES (?, ?, ?, ?)",
+                (document_sha256, filename, json.dumps(pages), time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO page_index (fingerprint, document_sha256) VALUES (?, ?)",
+                [(page["fingerprint"], document_sha256) for page in pages if page["fingerprint"]],
+            )
+
+    def get_pages(self, document_sha256: str):
+        """Page fingerprints and filename of a document, or None if it was never fingerprinted
+
+        Returns:
+            tuple | None: (filename, pages)
+        """
+        row = self._connect().execute(
+            "SELECT filename, pages FROM documents WHERE sha256 = ?", (document_sha256,)
+        ).fetchone()
+        return None if row is None else (row["filename"], json.loads(row["pages"]))
+
+    def most_similar_document(self, document_sha256: str, fingerprints: list, query: str):
+        """The other document, analyzed for an equivalent query, that shares the most pages
+
+        Returns:
+            tuple | None: (sha256, number of shared distinct pages)
+        """
+        row = self._connect().execute(
+            "SELECT p.document_sha256, COUNT(*) AS shared FROM page_index p "
+            "JOIN analyses a ON a.document_sha256 = p.document_sha256 AND a.query_key = ? "
+            "WHERE p.fingerprint IN (SELECT value FROM json_each(?)) AND p.document_sha256 != ? "
+            "GROUP BY p.document_sha256 ORDER BY shared DESC LIMIT 1",
+            (normalize_query(query), json.dumps(sorted(set(filter(None, fingerprints)))), document_sha256),
+        ).fetchone()
+        return None if row is None else (row["document_sha256"], row["shared"])
+
+    def _record(self, row: sqlite3.Row) -> dict:
+        record = {
+            name: row[name]
+            for name in ("id", "document_sha256", "query", "filename", "created", "accessed", "hits")
+        }
+        record.update(json.loads(zlib.decompress(row["payload"])))
+        return record
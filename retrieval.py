@@ -0,0 +1,145 @@
+## Importing libraries and files
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+
+from cache import LRUCache, document_cache
+from extraction import extract_pages, join_pages
+from ingest import resolve_document
+
+## Retrieval configuration (overridable through environment variables)
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500"))
+INDEX_CACHE_ENTRIES = int(os.getenv("RETRIEVAL_INDEX_CACHE_ENTRIES", "32"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9\-\.]*[a-z0-9]|[a-z0-9]")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_pages(pages: list, chunk_chars: int = CHUNK_CHARS) -> list:
+    """Split page texts into paragraph-aligned chunks no longer than chunk_chars
+
+    Args:
+        pages: Text of each page, in page order ("" for pages without text)
+        chunk_chars: Target maximum chunk length
+
+    Returns:
+        list[tuple[int, str]]: (1-based page number, chunk text) pairs
+    """
+    chunks = []
+    for page_number, page_text in enumerate(pages, start=1):
+        current = ""
+        for paragraph in re.split(r"\n\s*\n", page_text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if current and len(current) + len(paragraph) + 2 > chunk_chars:
+                chunks.append((page_number, current))
+                current = ""
+            # Paragraphs longer than a chunk (dense tables) are cut on line boundaries
+            while len(paragraph) > chunk_chars:
+                cut = paragraph.rfind("\n", 0, chunk_chars)
+                cut = cut if cut > 0 else chunk_chars
+                chunks.append((page_number, paragraph[:cut]))
+                paragraph = paragraph[cut:].lstrip("\n")
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append((page_number, current))
+    return chunks
+
+
+## BM25 chunk index
+class ChunkIndex:
+    """Okapi BM25 index over document chunks stored as a sparse weight matrix
+
+    Every (chunk, term) weight is precomputed at build time, so scoring a query is
+    one sparse column slice and row sum.
+    """
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self.vocabulary = {}
+
+        rows, cols = [], []
+        lengths = np.zeros(len(chunks), dtype=np.float64)
+        for row, (_, text) in enumerate(chunks):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            for token in tokens:
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+
+        shape = (len(chunks), max(len(self.vocabulary), 1))
+        # Duplicate (row, col) pairs are summed, giving raw term frequencies
+        tf = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)), shape=shape
+        )
+        tf.sum_duplicates()
+
+        doc_freq = np.bincount(tf.indices, minlength=shape[1])
+        idf = np.log1p((len(chunks) - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_length = lengths.mean() if len(chunks) else 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (avg_length or 1.0))
+
+        weights = tf.copy()
+        row_of_entry = np.repeat(np.arange(shape[0]), np.diff(tf.indptr))
+        weights.data = idf[tf.indices] * tf.data * (BM25_K1 + 1) / (tf.data + norm[row_of_entry])
+        self.weights = weights.tocsc()
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Return the top_k chunks most relevant to query
+
+        Args:
+            query: Free-text query
+            top_k: Number of chunks to return
+
+        Returns:
+            list[tuple[float, int, str]]: (score, page number, chunk text), best first
+        """
+        columns = sorted({self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary})
+        if not columns or not self.chunks:
+            return []
+        scores = np.asarray(self.weights[:, columns].sum(axis=1)).ravel()
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[i]), self.chunks[i][0], self.chunks[i][1]) for i in best]
+
+
+_index_cache = LRUCache(INDEX_CACHE_ENTRIES)
+
+
+def build_index(path: str, pages: list = None) -> ChunkIndex:
+    """Build (or fetch) the chunk index of a PDF, keyed by its content hash
+
+    Building also seeds the parsed-document cache, so a later full read of the
+    same file does not extract it again.
+
+    Args:
+        path: Path of the pdf file, or a registered document reference
+        pages: Page texts already extracted elsewhere (e.g. by a batch), to skip extraction
+
+    Returns:
+        ChunkIndex: Index over the document's chunks
+    """
+    source, digest = resolve_document(path)
+    index = _index_cache.get(digest)
+    if index is not None:
+        return index
+    if pages is None:
+        pages = extract_pages(source)
+    if document_cache.get(digest) is None:
+        document_cache.put(digest, join_pages(pages))
+    index = ChunkIndex(chunk_pages(pages))
+    # The cache is bounded by entry count: each index costs one unit
+    _index_cache.put(digest, index, 1)
+    return index
@@ -0,0 +1,221 @@
+## Importing libraries and files
+import difflib
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+
+from statements import text_line_items
+
+## Revision configuration (overridable through environment variables)
+# A stored document is treated as an earlier version when at least this share of
+# the new document's pages is identical to its pages
+REVISION_MIN_OVERLAP = float(os.getenv("REVISION_MIN_OVERLAP", "0.5"))
+
+# Page tags deciding which tasks a changed page affects
+STATEMENTS = "statements"  # rows of the primary financial statements
+FIGURES = "figures"        # narrative with many reported numbers (MD&A, highlights)
+RISK = "risk"              # risk factors, legal proceedings, going-concern language
+
+_FIGURE = re.compile(r"\$\s?\d|\d%|\d[\d,]*\.\d+|\(\d[\d,]*\)")
+_RISK = re.compile(
+    r"risk factors|legal proceedings|litigation|going concern|contingenc|material weakness|covenant",
+    re.IGNORECASE,
+)
+FIGURES_MIN_COUNT = 5
+EXCERPT_CHARS = 300
+EXCERPT_PAGES = 5
+
+
+def _fingerprint(text: str) -> str:
+    # Whitespace-insensitive, so re-flowed but otherwise identical pages still match
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32] if normalized else ""
+
+
+def page_tags(text: str) -> list:
+    tags = []
+    if text_line_items(text):
+        tags.append(STATEMENTS)
+    if len(_FIGURE.findall(text)) >= FIGURES_MIN_COUNT:
+        tags.append(FIGURES)
+    if _RISK.search(text):
+        tags.append(RISK)
+    return tags
+
+
+def fingerprint_pages(pages: list) -> list:
+    """Fingerprint and tag every page of an extracted document
+
+    Args:
+        pages: Text of each page, in page order
+
+    Returns:
+        list[dict]: {"fingerprint", "tags"} per page; pages without text have an empty fingerprint
+    """
+    return [{"fingerprint": _fingerprint(text), "tags": page_tags(text)} for text in pages]
+
+
+@dataclass
+class PageDiff:
+    """Page-level difference between an earlier version of a document and the current one"""
+    changed: list = field(default_factory=list)  # 1-based pages of the new version that are new or edited
+    removed: list = field(default_factory=list)  # 1-based pages of the old version that were edited or dropped
+    tags: set = field(default_factory=set)       # tags of every changed and removed page
+    unchanged: int = 0
+
+    @property
+    def identical(self) -> bool:
+        return not self.changed and not self.removed
+
+
+def diff_pages(old: list, new: list) -> PageDiff:
+    """Align two fingerprinted versions of a document and collect the pages that differ
+
+    Args:
+        old: fingerprint_pages() of the earlier version
+        new: fingerprint_pages() of the current version
+
+    Returns:
+        PageDiff: Changed, removed and unchanged pages
+    """
+    matcher = difflib.SequenceMatcher(
+        a=[page["fingerprint"] for page in old], b=[page["fingerprint"] for page in new], autojunk=False
+    )
+    diff = PageDiff()
+    for operation, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if operation == "equal":
+            diff.unchanged += new_end - new_start
+            continue
+        for index in range(new_start, new_end):
+            diff.changed.append(index + 1)
+            diff.tags.update(new[index]["tags"])
+        for index in range(old_start, old_end):
+            diff.removed.append(index + 1)
+            diff.tags.update(old[index]["tags"])
+    return diff
+
+
+def tasks_to_rerun(diff: PageDiff) -> set:
+    """Names of the tasks whose inputs the revision changed
+
+    Verification re-checks any change. The financial analysis depends on the
+    statements and other reported figures; investment and risk depend on the
+    statements (through their ratio tools) and on the analysis, and risk also on
+    risk-related disclosures. Pages with none of these tags (exhibits, governance
+    text) only need verification.
+    """
+    if diff.identical:
+        return set()
+    rerun = {"verification"}
+    if diff.tags & {STATEMENTS, FIGURES}:
+        rerun.add("financial_analysis")
+    if STATEMENTS in diff.tags or "financial_analysis" in rerun:
+        rerun.add("investment_analysis")
+    if diff.tags & {STATEMENTS, RISK} or "financial_analysis" in rerun:
+        rerun.add("risk_assessment")
+    return rerun
+
+
+def _page_ranges(pages: list) -> str:
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ", ".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def revision_context(diff: PageDiff, base_filename: str, pages: list = None) -> str:
+    """Prompt text telling re-run tasks what changed since the earlier version
+
+    Args:
+        diff: Page diff against the earlier version
+        base_filename: Name of the earlier version, for reference
+        pages: Text of each page of the current version (for short excerpts), if at hand
+
+    Returns:
+        str: Paragraph appended to the re-run tasks' descriptions
+    """
+    lines = [
+        f"REVISION: this document is a revised version of the previously analyzed {base_filename!r}. "
+        f"{diff.unchanged} pages are unchanged."
+    ]
+    if diff.changed:
+        lines.append(f"New or edited pages: {_page_ranges(diff.changed)}.")
+    if diff.removed:
+        lines.append(f"Pages of the earlier version that were edited or removed: {_page_ranges(diff.removed)}.")
+    lines.append(
+        "Concentrate on what the revision changes: search the new or edited pages, state how "
+        "they alter the earlier conclusions, and keep the rest of your report consistent with them."
+    )
+    for page_number in diff.changed[:EXCERPT_PAGES] if pages else []:
+        excerpt = re.sub(r"\s+", " ", pages[page_number - 1]).strip()[:EXCERPT_CHARS]
+        if excerpt:
+            lines.append(f"Page {page_number} begins: \"{excerpt}\"")
+    return "\n".join(lines)
+
+
+@dataclass
+class RevisionPlan:
+    """How to analyze a revised document: which stored task outputs to reuse and what to re-run"""
+    base_sha256: str
+    base_analysis_id: str
+    diff: PageDiff
+    rerun: set
+    reused: dict   # task name -> stored output text
+    context: str   # {revision_context} input for the re-run tasks
+
+    def summary(self) -> dict:
+        return {
+            "base_document_sha256": self.base_sha256,
+            "base_analysis_id": self.base_analysis_id,
+            "changed_pages": self.diff.changed,
+            "removed_pages": self.diff.removed,
+            "rerun": sorted(self.rerun),
+            "reused": sorted(self.reused),
+        }
+
+
+def plan_revision(store, document_sha256: str, fingerprints: list, query: str,
+                  base_document: str = None, pages: list = None):
+    """Find the earlier version of a document and decide which tasks to re-run
+
+    Args:
+        store: ResultStore holding earlier analyses and page fingerprints
+        document_sha256: SHA-256 of the current document
+        fingerprints: fingerprint_pages() of the current document
+        query: Analysis query; only an earlier analysis of an equivalent query is reused
+        base_document: SHA-256 of the earlier version; found by page overlap when omitted
+        pages: Page texts of the current document, for excerpts in the revision context
+
+    Returns:
+        RevisionPlan | None: None when there is no usable earlier version
+    """
+    if base_document is None:
+        match = store.most_similar_document(
+            document_sha256, [page["fingerprint"] for page in fingerprints], query
+        )
+        text_pages = sum(1 for page in fingerprints if page["fingerprint"])
+        if match is None or not text_pages or match[1] / text_pages < REVISION_MIN_OVERLAP:
+            return None
+        base_document = match[0]
+
+    base_pages = store.get_pages(base_document)
+    base_analysis = store.lookup(base_document, query)
+    if base_pages is None or base_analysis is None:
+        return None
+    base_filename, base_fingerprints = base_pages
+
+    diff = diff_pages(base_fingerprints, fingerprints)
+    rerun = tasks_to_rerun(diff)
+    reused = {task["name"]: task["output"] for task in base_analysis["tasks"] if task["name"] not in rerun}
+    return RevisionPlan(
+        base_sha256=base_document,
+        base_analysis_id=base_analysis["id"],
+        diff=diff,
+        rerun=rerun,
+        reused=reused,
+        context=revision_context(diff, base_filename, pages) if rerun else "",
+    )
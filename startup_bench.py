@@ -0,0 +1,110 @@
+## Importing libraries and files
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Runs in a fresh interpreter per sample, so every import is cold
+_BOOT = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.crew_template().fill(1)
+ready = time.perf_counter()
+print(json.dumps({"import_main": imported - started, "crew_ready": ready - started}))
+"""
+
+_SETUP = """
+import json, sys, time
+import main
+from pipeline import copy_tasks
+template = main.crew_template()
+template.fill(1)
+runs = int(sys.argv[1])
+started = time.perf_counter()
+for _ in range(runs):
+    copy_tasks(template.tasks)
+copied = time.perf_counter()
+for _ in range(runs):
+    with template.checkout():
+        pass
+checked_out = time.perf_counter()
+print(json.dumps({"copy_tasks": (copied - started) / runs, "checkout": (checked_out - copied) / runs}))
+"""
+
+
+def _run(code: str, *args) -> dict:
+    env = dict(os.environ, OTEL_SDK_DISABLED="true", CREW_PREWARM="false")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", code, *args], env=env, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    sample = json.loads(completed.stdout.strip().splitlines()[-1])
+    sample["process"] = time.perf_counter() - started
+    return sample
+
+
+def _slowest_imports(count: int) -> list:
+    """Modules with the largest cumulative import time, from python -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main; main.crew_template()"],
+        env=dict(os.environ, OTEL_SDK_DISABLED="true"), capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Top-level imports and the ones they make directly; deeper ones are counted in their importer
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        modules.append({"module": name.strip(), "depth": depth, "seconds": int(cumulative) / 1e6})
+    return sorted(modules, key=lambda module: module["seconds"], reverse=True)[:count]
+
+
+def _summary(samples: list) -> dict:
+    return {
+        key: {"median_ms": round(statistics.median(s[key] for s in samples) * 1000, 2),
+              "min_ms": round(min(s[key] for s in samples) * 1000, 2)}
+        for key in samples[0]
+    }
+
+
+def main(argv: list = None):
+    """Measure worker boot time and per-request crew setup
+
+    Boot: time to import main (what a web worker pays before serving) and to have
+    the crew template ready (what prewarming pays in the background). Setup: cost
+    per run of copying the template's tasks and agents versus checking out an
+    idle copy.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark worker startup and per-request crew setup")
+    parser.add_argument("--repeat", type=int, default=5, help="Cold interpreter starts to sample")
+    parser.add_argument("--runs", type=int, default=50, help="Crew setups to average per sample")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": sys.version.split()[0],
+        "boot": _summary([_run(_BOOT) for _ in range(args.repeat)]),
+        "crew_setup": _summary([_run(_SETUP, str(args.runs)) for _ in range(args.repeat)]),
+        "slowest_imports": _slowest_imports(args.top),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+## Importing libraries and files
+import re
+from dataclasses import dataclass, field, fields
+
+import numpy as np
+
+from cache import LRUCache
+from extraction import open_pdf
+from ingest import resolve_document
+
+## Line-item recognition
+# Order matters: the first matching pattern wins, so totals that contain other
+# labels ("total liabilities and equity") are excluded before the plain ones.
+LINE_ITEMS = [
+    ("income", "revenue", r"^(total\s+)?(net\s+)?(revenues?|sales)(\s+net)?$|^total\s+net\s+(revenues?|sales)$"),
+    ("income", "cost_of_revenue", r"^(total\s+)?cost\s+of\s+(revenues?|sales|goods\s+sold)$"),
+    ("income", "gross_profit", r"^gross\s+(profit|margin)$"),
+    ("income", "operating_income", r"^(income|profit)\s+from\s+operations$|^operating\s+(income|profit)(\s+\(loss\))?$"),
+    ("income", "ebitda", r"^(adjusted\s+)?ebitda$"),
+    ("income", "depreciation", r"^depreciation(\s+and|\s*&)\s+amortization$"),
+    ("income", "interest_expense", r"^interest\s+expense(,?\s+net)?$"),
+    # Attributable to the company or its common stockholders, never to noncontrolling (minority) interests
+    ("income", "net_income", r"^net\s+(income|earnings|profit)(\s+\(loss\))?(\s+attributable\s+to\s+(?!.*(non-?\s*controlling|minority)).+)?$"),
+    ("income", "eps", r"^(diluted\s+)?(net\s+)?(income|earnings)\s+per\s+share(\s*[-:,]?\s*diluted)?$"),
+    ("balance", "total_liabilities_and_equity", r"^total\s+liabilities\s+and\s+(stockholders|shareholders)?.*equity$"),
+    ("balance", "current_assets", r"^total\s+current\s+assets$"),
+    ("balance", "total_assets", r"^total\s+assets$"),
+    ("balance", "inventory", r"^inventor(y|ies)(,?\s+net)?$"),
+    ("balance", "current_liabilities", r"^total\s+current\s+liabilities$"),
+    ("balance", "total_liabilities", r"^total\s+liabilities$"),
+    ("balance", "total_debt", r"^(total\s+)?(long[-\s]term\s+)?debt(,?\s+net\s+of\s+current\s+portion)?$"),
+    ("balance", "shareholders_equity", r"^total\s+(stockholders|shareholders)['’]?\s+equity$|^total\s+equity$"),
+    ("cash_flow", "operating_cash_flow", r"^net\s+cash\s+(provided\s+by|from|provided\s+by\s+\(used\s+in\))\s+operating\s+activities$"),
+    ("cash_flow", "capital_expenditure", r"^(capital\s+expenditures?|purchases?\s+of\s+property(,)?\s+(plant\s+)?and\s+equipment.*)$"),
+]
+_LINE_ITEM_PATTERNS = [(statement, name, re.compile(pattern)) for statement, name, pattern in LINE_ITEMS]
+
+_NUMBER = re.compile(r"^\(?-?\$?\s*\d[\d,]*(\.\d+)?\)?%?$")
+_DASH = re.compile(r"^[-–—]+$")
+# A currency symbol in a cell (or token) of its own, set apart from the amount it belongs to
+_CURRENCY_MARKER = re.compile(r"^[$€£¥]$")
+_TEXT_ROW = re.compile(r"^(?P<label>[A-Za-z][^\d$]*?)\s+(?P<values>(\(?-?\$?\s*[\d,.]+\)?%?|[-–—])(\s+(\(?-?\$?\s*[\d,.]+\)?%?|[-–—]))*)\s*$")
+
+
+def parse_number(cell: str) -> float:
+    """Parse a financial-statement cell such as "$1,234", "(56)" or "—" into a float
+
+    Returns:
+        float: Parsed value (parentheses mean negative, dashes mean zero), or NaN
+    """
+    cell = (cell or "").strip()
+    if _DASH.match(cell):
+        return 0.0
+    if not _NUMBER.match(cell):
+        return np.nan
+    negative = cell.startswith("(") or cell.startswith("-")
+    value = float(re.sub(r"[^\d.]", "", cell))
+    return -value if negative else value
+
+
+def _normalize_label(label: str) -> str:
+    label = re.sub(r"[^a-z&'’\s\-\(\),]", " ", label.lower())
+    return re.sub(r"\s+", " ", label).strip(" ,:")
+
+
+def classify_label(label: str):
+    """Map a row label to (statement, line item), or None if it is not a tracked item"""
+    normalized = _normalize_label(label)
+    for statement, name, pattern in _LINE_ITEM_PATTERNS:
+        if pattern.match(normalized):
+            return statement, name
+    return None
+
+
+## Typed statement structure
+def _empty():
+    return np.full(0, np.nan)
+
+
+@dataclass
+class IncomeStatement:
+    revenue: np.ndarray = field(default_factory=_empty)
+    cost_of_revenue: np.ndarray = field(default_factory=_empty)
+    gross_profit: np.ndarray = field(default_factory=_empty)
+    operating_income: np.ndarray = field(default_factory=_empty)
+    ebitda: np.ndarray = field(default_factory=_empty)
+    depreciation: np.ndarray = field(default_factory=_empty)
+    interest_expense: np.ndarray = field(default_factory=_empty)
+    net_income: np.ndarray = field(default_factory=_empty)
+    eps: np.ndarray = field(default_factory=_empty)
+
+
+@dataclass
+class BalanceSheet:
+    total_liabilities_and_equity: np.ndarray = field(default_factory=_empty)
+    current_assets: np.ndarray = field(default_factory=_empty)
+    total_assets: np.ndarray = field(default_factory=_empty)
+    inventory: np.ndarray = field(default_factory=_empty)
+    current_liabilities: np.ndarray = field(default_factory=_empty)
+    total_liabilities: np.ndarray = field(default_factory=_empty)
+    total_debt: np.ndarray = field(default_factory=_empty)
+    shareholders_equity: np.ndarray = field(default_factory=_empty)
+
+
+@dataclass
+class CashFlowStatement:
+    operating_cash_flow: np.ndarray = field(default_factory=_empty)
+    capital_expenditure: np.ndarray = field(default_factory=_empty)
+
+
+@dataclass
+class FinancialStatements:
+    """Line items of the three primary statements, one array entry per reported period
+
+    Periods are in document column order (most recent first in most filings);
+    items that were not found are NaN.
+    """
+    periods: int = 0
+    income: IncomeStatement = field(default_factory=IncomeStatement)
+    balance: BalanceSheet = field(default_factory=BalanceSheet)
+    cash_flow: CashFlowStatement = field(default_factory=CashFlowStatement)
+
+    def found_items(self) -> list:
+        return [
+            f"{statement}.{item.name}"
+            for statement in ("income", "balance", "cash_flow")
+            for item in fields(getattr(self, statement))
+            if np.isfinite(getattr(getattr(self, statement), item.name)).any()
+        ]
+
+
+## Extraction
+def _blank_cell(cell) -> bool:
+    return cell is None or not cell.strip() or bool(_CURRENCY_MARKER.match(cell.strip()))
+
+
+def _rows_from_page(page) -> list:
+    """Collect (label, values) rows from a page's ruled tables, falling back to its text lines
+
+    Values stay in their period's position: an empty cell is NaN in place. Only
+    columns holding nothing but currency markers or spacing are dropped, so a "$"
+    set apart on some rows does not shift the amounts after it.
+    """
+    rows = []
+    for table in page.extract_tables():
+        width = max((len(row) for row in table), default=0)
+        table = [list(row) + [None] * (width - len(row)) for row in table]
+        columns = [c for c in range(width) if not all(_blank_cell(row[c]) for row in table)]
+        if not columns:
+            continue
+        label_column, columns = columns[0], columns[1:]
+        for row in table:
+            label = (row[label_column] or "").strip()
+            values = [np.nan if _blank_cell(row[c]) else parse_number(row[c]) for c in columns]
+            if label and not np.isnan(values).all():
+                rows.append((label, values))
+    if rows:
+        return rows
+    for line in (page.extract_text() or "").splitlines():
+        match = _TEXT_ROW.match(line.strip())
+        if match:
+            tokens = [v for v in match.group("values").split() if not _CURRENCY_MARKER.match(v)]
+            rows.append((match.group("label"), [parse_number(v) for v in tokens]))
+    return rows
+
+
+def text_line_items(text: str) -> set:
+    """Tracked line items that appear as label-and-values rows in plain page text
+
+    Returns:
+        set[tuple[str, str]]: (statement, line item) pairs found
+    """
+    found = set()
+    for line in (text or "").splitlines():
+        match = _TEXT_ROW.match(line.strip())
+        if match:
+            key = classify_label(match.group("label"))
+            if key:
+                found.add(key)
+    return found
+
+
+def extract_statements(source) -> FinancialStatements:
+    """Parse the income statement, balance sheet and cash-flow statement of a PDF
+
+    The first occurrence of each line item wins, which in a filing is the primary
+    statement rather than a later note or segment table.
+
+    Args:
+        source: Path of the pdf file, or its bytes
+
+    Returns:
+        FinancialStatements: Parsed line items
+    """
+    found = {}
+    with open_pdf(source) as pdf:
+        for page in pdf.pages:
+            try:
+                for label, values in _rows_from_page(page):
+                    key = classify_label(label)
+                    if key and not np.isnan(values).all() and key not in found:
+                        found[key] = values
+            finally:
+                page.close()
+
+    statements = FinancialStatements(periods=max((len(v) for v in found.values()), default=0))
+    for (statement, name), values in found.items():
+        padded = np.full(statements.periods, np.nan)
+        padded[:len(values)] = values
+        setattr(getattr(statements, statement), name, padded)
+    for statement in (statements.income, statements.balance, statements.cash_flow):
+        for item in fields(statement):
+            if getattr(statement, item.name).size != statements.periods:
+                setattr(statement, item.name, np.full(statements.periods, np.nan))
+
+    # EBITDA is rarely reported on the face of the statements; derive it when possible
+    income = statements.income
+    income.ebitda = np.where(np.isnan(income.ebitda), income.operating_income + income.depreciation, income.ebitda)
+    return statements
+
+
+## Ratios
+RATIOS = [
+    # name, numerator, denominator
+    ("gross_margin", "gross_profit", "revenue"),
+    ("operating_margin", "operating_income", "revenue"),
+    ("net_margin", "net_income", "revenue"),
+    ("ebitda_margin", "ebitda", "revenue"),
+    ("return_on_equity", "net_income", "shareholders_equity"),
+    ("return_on_assets", "net_income", "total_assets"),
+    ("debt_to_equity", "total_debt", "shareholders_equity"),
+    ("liabilities_to_equity", "total_liabilities", "shareholders_equity"),
+    ("current_ratio", "current_assets", "current_liabilities"),
+    ("quick_ratio", "quick_assets", "current_liabilities"),
+    ("interest_coverage", "operating_income", "interest_expense"),
+    ("asset_turnover", "revenue", "total_assets"),
+    ("price_to_earnings", "share_price", "eps"),
+]
+
+
+def compute_ratios(statements: FinancialStatements, share_price: float = None) -> dict:
+    """Compute the standard ratio set for every period in one vectorized division
+
+    Args:
+        statements: Parsed financial statements
+        share_price: Current share price, needed for P/E (omitted when None)
+
+    Returns:
+        dict[str, np.ndarray]: Ratio name -> value per period (NaN where not computable)
+    """
+    income, balance, cash_flow = statements.income, statements.balance, statements.cash_flow
+    periods = statements.periods
+    items = {item.name: getattr(income, item.name) for item in fields(income)}
+    items.update({item.name: getattr(balance, item.name) for item in fields(balance)})
+    items.update({item.name: getattr(cash_flow, item.name) for item in fields(cash_flow)})
+    items["gross_profit"] = np.where(
+        np.isnan(income.gross_profit), income.revenue - income.cost_of_revenue, income.gross_profit
+    )
+    items["quick_assets"] = balance.current_assets - np.nan_to_num(balance.inventory)
+    items["interest_expense"] = np.abs(income.interest_expense)
+    items["share_price"] = np.full(periods, np.nan if share_price is None else float(share_price))
+
+    numerators = np.vstack([items[numerator] for _, numerator, _ in RATIOS])
+    denominators = np.vstack([items[denominator] for _, _, denominator in RATIOS])
+    values = np.divide(
+        numerators, denominators,
+        out=np.full(numerators.shape, np.nan),
+        where=np.isfinite(denominators) & (denominators != 0)
+    )
+    ratios = {name: values[row] for row, (name, _, _) in enumerate(RATIOS)}
+
+    # Period-over-period metrics: columns run newest to oldest
+    ratios["free_cash_flow"] = cash_flow.operating_cash_flow - np.abs(np.nan_to_num(cash_flow.capital_expenditure))
+    growth = np.full(periods, np.nan)
+    if periods > 1:
+        previous = income.revenue[1:]
+        np.divide(income.revenue[:-1] - previous, np.abs(previous), out=growth[:-1],
+                  where=np.isfinite(previous) & (previous != 0))
+    ratios["revenue_growth"] = growth
+    return ratios
+
+
+_statements_cache = LRUCache(64)
+
+
+def load_statements(path: str) -> FinancialStatements:
+    """extract_statements() for a file path or document reference, cached by content hash"""
+    source, digest = resolve_document(path)
+    statements = _statements_cache.get(digest)
+    if statements is None:
+        statements = extract_statements(source)
+        _statements_cache.put(digest, statements, 1)
+    return statements
+
+
+def format_values(values: np.ndarray, percent: bool = False) -> str:
+    """Render one value per period, e.g. "12.5% | 11.0%", with n/a for missing periods"""
+    if values.size == 0:
+        return "n/a"
+    rendered = []
+    for value in values:
+        if np.isnan(value):
+            rendered.append("n/a")
+        elif percent:
+            rendered.append(f"{value * 100:.1f}%")
+        else:
+            rendered.append(f"{value:,.2f}")
+    return " | ".join(rendered)
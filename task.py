@@ -2,10 +2,11 @@
 from crewai import Task
 
 from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from tools import search_tool, FinancialDocumentTool
+from tools import search_tool, DocumentSearchTool, InvestmentTool, RiskTool
 
 ## Creating a verification task (RUNS FIRST)
 verification = Task(
+    name="verification",
     description="""Verify the financial document meets quality standards for: {query}
 
 Steps to verify:
@@ -15,7 +16,11 @@ Steps to verify:
 4. Identify any missing critical financial information
 5. Flag any anomalies, inconsistencies, or red flags
 
-Use the FinancialDocumentTool to access and examine the document.""",
+Document to verify: {document}
+Use the Financial Document Search tool (with path "{document}") to examine the document:
+run focused searches for each required section (e.g. "income statement", "balance sheet",
+"cash flow statement") rather than reading the whole document.
+{revision_context}""",
 
     expected_output="""Document verification report with:
 
@@ -27,17 +32,19 @@ Use the FinancialDocumentTool to access and examine the document.""",
    - ✅ Key metrics and ratios included
 3. **Data Quality Assessment**: Any inconsistencies, errors, or missing calculations
 4. **Red Flags**: Unusual items requiring further investigation
-5. **Verification Status**: APPROVED / NEEDS REVIEW / REJECTED with justification
+5. **Verification Status**: exactly one of APPROVED, NEEDS REVIEW or REJECTED, followed by the justification
 
-Only approve documents that contain actual financial data and meet reporting standards.""",
+Only approve documents that contain actual financial data and meet reporting standards.
+REJECTED ends the analysis: the other agents do not run on a rejected document.""",
 
     agent=verifier,
-    tools=[FinancialDocumentTool()],
+    tools=[DocumentSearchTool()],
     async_execution=False,
 )
 
 ## Creating financial analysis task (RUNS SECOND)
 analyze_financial_document = Task(
+    name="financial_analysis",
     description="""Thoroughly analyze the verified financial document to answer: {query}
 
 Analysis steps:
@@ -49,7 +56,12 @@ Analysis steps:
 6. Highlight key risks and opportunities identified in the data
 7. Provide evidence-based insights directly relevant to the user's query
 
-Use the FinancialDocumentTool to read actual document data. Base all analysis on factual data from the document.""",
+Document to analyze: {document}
+Use the Financial Document Search tool (with path "{document}") and focused queries
+(e.g. "total revenue net income", "total liabilities shareholders equity") to pull the
+relevant passages of the document.
+Base all analysis on factual data from the document.
+{revision_context}""",
 
     expected_output="""A comprehensive financial analysis report including:
 
@@ -86,13 +98,14 @@ Use the FinancialDocumentTool to read actual document data. Base all analysis on
 **All analysis must cite specific data from the document. No speculation or assumptions.**""",
 
     agent=financial_analyst,
-    tools=[FinancialDocumentTool(), search_tool],
+    tools=[DocumentSearchTool(), search_tool],
     async_execution=False,
     context=[verification]  # Depends on verification completing first
 )
 
-## Creating investment analysis task (RUNS THIRD)
+## Creating investment analysis task (RUNS THIRD, alongside risk assessment)
 investment_analysis = Task(
+    name="investment_analysis",
     description="""Based on the verified financial analysis, provide professional investment recommendations for: {query}
 
 Requirements:
@@ -104,7 +117,10 @@ Requirements:
 6. Include proper regulatory disclaimers
 7. Be specific about entry points, position sizing, and time horizons
 
-Context: Use insights from the financial_analyst's completed analysis and verifier's assessment.""",
+Context: Use insights from the financial_analyst's completed analysis and verifier's assessment.
+Use the Investment Analysis Tool (with path "{document}") for key figures and ratios parsed from the
+statements instead of recomputing them.
+{revision_context}""",
 
     expected_output="""Professional investment recommendation report including:
 
@@ -142,13 +158,14 @@ Context: Use insights from the financial_analyst's completed analysis and verifi
 **Base all recommendations on actual financial data. No speculation or unsubstantiated claims.**""",
 
     agent=investment_advisor,
-    tools=[search_tool],
+    tools=[InvestmentTool(), search_tool],
     async_execution=False,
     context=[verification, analyze_financial_document]  # Depends on previous tasks
 )
 
-## Creating risk assessment task (RUNS FOURTH)
+## Creating risk assessment task (RUNS THIRD, alongside investment analysis)
 risk_assessment = Task(
+    name="risk_assessment",
     description="""Conduct comprehensive risk assessment using the financial analysis for: {query}
 
 Risk analysis framework:
@@ -158,7 +175,9 @@ Risk analysis framework:
 4. **Regulatory/Compliance Risks**: Industry-specific regulations, pending legal issues
 5. **Quantification**: Assign risk levels (Low/Medium/High) with specific evidence from financials
 
-Use data from the financial analyst's work and market research. Provide objective, evidence-based risk analysis.""",
+Use data from the financial analyst's work and market research, and the Risk Assessment Tool (with path
+"{document}") for precomputed leverage, liquidity and coverage ratios. Provide objective, evidence-based risk analysis.
+{revision_context}""",
 
     expected_output="""Comprehensive risk assessment report:
 
@@ -215,7 +234,7 @@ Use data from the financial analyst's work and market research. Provide objectiv
 **All risk assessments must cite specific data from the financial document and analysis.**""",
 
     agent=risk_assessor,
-    tools=[search_tool],
+    tools=[RiskTool(), search_tool],
     async_execution=False,
-    context=[verification, analyze_financial_document, investment_analysis]  # Depends on all previous tasks
+    context=[verification, analyze_financial_document]  # Independent of investment_analysis, so the two can run concurrently
 )
\ No newline at end of file
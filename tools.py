@@ -2,13 +2,44 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from crewai_tools import FileReadTool
+from typing import Type
+
 from crewai.tools import BaseTool
-from crewai_tools import SerperDevTool
-import pdfplumber
+from crewai.utilities.events import crewai_event_bus, ToolUsageFinishedEvent
+from pydantic import BaseModel, Field
+
+from cache import document_cache
+from extraction import extract_text
+from ingest import resolve_document
+from retrieval import build_index
+from metrics import record
+from statements import compute_ratios, format_values, load_statements
+from web_search import web_search
 
 ## Creating search tool
-search_tool = SerperDevTool()
+class WebSearchInput(BaseModel):
+    search_query: str = Field(..., description="Mandatory search query you want to use to search the internet")
+
+class WebSearchTool(BaseTool):
+    name: str = "Search the internet with Serper"
+    description: str = (
+        "A tool that can be used to search the internet with a search_query. "
+        "Supports different search types: 'search' (default), 'news'"
+    )
+    args_schema: Type[BaseModel] = WebSearchInput
+
+    def _run(self, search_query: str) -> str:
+        # Normalized, cached and coalesced across requests; see web_search.py for the backends
+        return web_search.search(search_query)
+
+search_tool = WebSearchTool()
+
+## Recording every tool invocation (including search) as an instrumented stage
+@crewai_event_bus.on(ToolUsageFinishedEvent)
+def record_tool_usage(source, event):
+    seconds = (event.finished_at - event.started_at).total_seconds()
+    record("tool_call", seconds, started=event.started_at.timestamp(),
+           tool=event.tool_name, cache="hit" if event.from_cache else "miss")
 
 ## Creating custom pdf reader tool
 class FinancialDocumentTool(BaseTool):
@@ -19,64 +50,162 @@ class FinancialDocumentTool(BaseTool):
         """Tool to read data from a pdf file from a path
 
         Args:
-            path (str): Path of the pdf file.
+            path (str): Path of the pdf file, or the document reference given in the task.
 
         Returns:
             str: Full Financial Document file content
         """
         try:
-            with pdfplumber.open(path) as pdf:
-                content = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        content += page_text + "\n"
-            
-            # Clean and format the content
-            while "\n\n\n" in content:
-                content = content.replace("\n\n\n", "\n\n")
-                
+            # Identical bytes parse to identical text, so reuse earlier extractions
+            source, digest = resolve_document(path)
+            cached = document_cache.get(digest)
+            if cached is not None:
+                return cached
+
+            # Pages are extracted in parallel and normalized in a single pass
+            content = extract_text(source)
+
+            document_cache.put(digest, content)
             return content
             
         except Exception as e:
             return f"Error reading financial document: {str(e)}"
 
+## Creating relevance-based document search tool
+class DocumentSearchTool(BaseTool):
+    name: str = "Financial Document Search"
+    description: str = (
+        "Searches a financial document PDF and returns only the passages most relevant to a query, "
+        "with their page numbers. Use focused queries such as 'consolidated balance sheet total assets'."
+    )
+
+    def _run(self, query: str, path: str = 'data/sample.pdf', top_k: int = 5) -> str:
+        """Tool to retrieve the passages of a pdf file most relevant to a query
+
+        Args:
+            query (str): What to look for in the document.
+            path (str): Path of the pdf file, or the document reference given in the task.
+            top_k (int): Number of passages to return.
+
+        Returns:
+            str: Matching passages, best first, each labelled with its page number
+        """
+        try:
+            results = build_index(path).search(query, top_k=top_k)
+            if not results:
+                return f"No passages in the document match: {query}"
+            return "\n\n".join(
+                f"[Page {page_number}]\n{text}" for _, page_number, text in results
+            )
+
+        except Exception as e:
+            return f"Error searching financial document: {str(e)}"
+
 ## Creating Investment Analysis Tool
 class InvestmentTool(BaseTool):
     name: str = "Investment Analysis Tool"
-    description: str = "Analyzes financial document data for investment insights."
+    description: str = (
+        "Returns key figures and precomputed profitability, growth and valuation ratios parsed "
+        "directly from the income statement, balance sheet and cash-flow statement of a financial "
+        "document PDF. Values are listed per reported period, most recent first."
+    )
+
+    def _run(self, path: str = 'data/sample.pdf', share_price: float = None) -> str:
+        """Extract key figures and investment ratios from the document's financial statements
 
-    def _run(self, financial_document_data: str) -> str:
-        """Analyze financial document data for investment insights
-        
         Args:
-            financial_document_data: Processed financial document content
-            
+            path (str): Path of the pdf file, or the document reference given in the task.
+            share_price (float): Current share price, used for P/E when given.
+
         Returns:
-            str: Investment analysis results
+            str: Investment metrics report
         """
-        # Process and analyze the financial document data
-        processed_data = financial_document_data
-        
-        # Clean up the data format
-        processed_data = processed_data.replace("  ", " ")
-                
-        # TODO: Implement advanced investment analysis logic here
-        return f"Investment analysis completed for {len(processed_data)} characters of data"
+        try:
+            statements = load_statements(path)
+            if statements.periods == 0:
+                return "No financial statement line items could be parsed from the document"
+            ratios = compute_ratios(statements, share_price)
+            income, balance, cash_flow = statements.income, statements.balance, statements.cash_flow
+
+            lines = [
+                f"Periods parsed: {statements.periods} (most recent first)",
+                "Key Figures:",
+                f"- Revenue: {format_values(income.revenue)}",
+                f"- Net Income: {format_values(income.net_income)}",
+                f"- EBITDA: {format_values(income.ebitda)}",
+                f"- Operating Cash Flow: {format_values(cash_flow.operating_cash_flow)}",
+                f"- Free Cash Flow: {format_values(ratios['free_cash_flow'])}",
+                f"- Total Assets: {format_values(balance.total_assets)}",
+                f"- Total Liabilities: {format_values(balance.total_liabilities)}",
+                f"- Shareholders Equity: {format_values(balance.shareholders_equity)}",
+                "Ratios:",
+                f"- Revenue Growth: {format_values(ratios['revenue_growth'], percent=True)}",
+                f"- Gross Margin: {format_values(ratios['gross_margin'], percent=True)}",
+                f"- Operating Margin: {format_values(ratios['operating_margin'], percent=True)}",
+                f"- Net Margin: {format_values(ratios['net_margin'], percent=True)}",
+                f"- EBITDA Margin: {format_values(ratios['ebitda_margin'], percent=True)}",
+                f"- ROE: {format_values(ratios['return_on_equity'], percent=True)}",
+                f"- ROA: {format_values(ratios['return_on_assets'], percent=True)}",
+                f"- Asset Turnover: {format_values(ratios['asset_turnover'])}",
+                f"- EPS: {format_values(income.eps)}",
+                f"- P/E: {format_values(ratios['price_to_earnings'])}",
+            ]
+            return "\n".join(lines)
+
+        except Exception as e:
+            return f"Error analyzing financial statements: {str(e)}"
 
 ## Creating Risk Assessment Tool
 class RiskTool(BaseTool):
     name: str = "Risk Assessment Tool"
-    description: str = "Creates risk assessment from financial document data."
+    description: str = (
+        "Returns precomputed leverage, liquidity and coverage ratios parsed directly from the "
+        "financial statements of a financial document PDF, with threshold-based risk flags."
+    )
+
+    def _run(self, path: str = 'data/sample.pdf') -> str:
+        """Compute leverage, liquidity and coverage ratios and flag breached thresholds
 
-    def _run(self, financial_document_data: str) -> str:
-        """Create risk assessment from financial document data
-        
         Args:
-            financial_document_data: Processed financial document content
-            
+            path (str): Path of the pdf file, or the document reference given in the task.
+
         Returns:
-            str: Risk assessment results
-        """        
-        # TODO: Implement risk assessment logic here
-        return f"Risk assessment completed for financial data"
\ No newline at end of file
+            str: Risk metrics report
+        """
+        try:
+            statements = load_statements(path)
+            if statements.periods == 0:
+                return "No financial statement line items could be parsed from the document"
+            ratios = compute_ratios(statements)
+
+            lines = [
+                f"Periods parsed: {statements.periods} (most recent first)",
+                "Risk Metrics:",
+                f"- Debt-to-Equity: {format_values(ratios['debt_to_equity'])}",
+                f"- Liabilities-to-Equity: {format_values(ratios['liabilities_to_equity'])}",
+                f"- Current Ratio: {format_values(ratios['current_ratio'])}",
+                f"- Quick Ratio: {format_values(ratios['quick_ratio'])}",
+                f"- Interest Coverage: {format_values(ratios['interest_coverage'])}",
+                f"- Operating Cash Flow: {format_values(statements.cash_flow.operating_cash_flow)}",
+                f"- Free Cash Flow: {format_values(ratios['free_cash_flow'])}",
+            ]
+
+            # Flags are evaluated on the most recent period only
+            latest = {name: values[0] for name, values in ratios.items()}
+            flags = [
+                message for breached, message in [
+                    (latest["debt_to_equity"] > 2.0, "Leverage: debt-to-equity above 2.0"),
+                    (latest["current_ratio"] < 1.0, "Liquidity: current ratio below 1.0"),
+                    (latest["quick_ratio"] < 0.5, "Liquidity: quick ratio below 0.5"),
+                    (latest["interest_coverage"] < 3.0, "Solvency: interest coverage below 3.0x"),
+                    (statements.cash_flow.operating_cash_flow[0] < 0, "Cash flow: negative operating cash flow"),
+                    (latest["net_margin"] < 0, "Profitability: net loss in the latest period"),
+                    (latest["revenue_growth"] < 0, "Growth: revenue declined year over year"),
+                ] if breached
+            ]
+            lines.append("Risk Flags:")
+            lines.extend(f"- {flag}" for flag in flags or ["None of the standard thresholds are breached"])
+            return "\n".join(lines)
+
+        except Exception as e:
+            return f"Error assessing financial statement risk: {str(e)}"
@@ -0,0 +1,130 @@
+## Importing libraries and files
+import os
+import re
+from dataclasses import dataclass, field
+
+from cache import document_cache
+from extraction import extract_text
+from ingest import resolve_document
+from metrics import registry, stage
+from statements import text_line_items
+
+## Verification configuration (overridable through environment variables)
+# Reject obvious non-financial uploads locally, before any LLM call
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "true").lower() not in ("0", "false", "no")
+# Less extractable text than this means there is nothing to verify
+PRESCREEN_MIN_CHARS = int(os.getenv("PRESCREEN_MIN_CHARS", "200"))
+# Without statement rows, a document needs at least this many distinct financial terms
+PRESCREEN_MIN_TERMS = int(os.getenv("PRESCREEN_MIN_TERMS", "3"))
+
+APPROVED = "APPROVED"
+NEEDS_REVIEW = "NEEDS REVIEW"
+REJECTED = "REJECTED"
+
+_STATUS = re.compile(r"\b(approved|needs[\s_-]+review|rejected)\b", re.IGNORECASE)
+_STATUS_HEADING = re.compile(r"verification\s+status", re.IGNORECASE)
+
+FINANCIAL_TERMS = [
+    r"revenues?", r"net\s+(income|loss|earnings)", r"operating\s+income", r"gross\s+(profit|margin)",
+    r"ebitda", r"earnings\s+per\s+share", r"balance\s+sheets?", r"cash\s+flows?", r"total\s+assets",
+    r"liabilities", r"(stockholders|shareholders)['’]?\s+equity", r"fiscal\s+(year|quarter)",
+    r"form\s+10-[kq]", r"annual\s+report", r"quarterly\s+report", r"dividends?", r"auditor",
+]
+_FINANCIAL_TERMS = [re.compile(rf"\b{term}\b", re.IGNORECASE) for term in FINANCIAL_TERMS]
+
+
+def verification_status(text: str):
+    """Parse the verification status out of a verification report
+
+    The status is read from the "Verification Status" line (or the line after it).
+    A line naming several statuses, such as the echoed template
+    "APPROVED / NEEDS REVIEW / REJECTED", is ambiguous and gives None.
+
+    Returns:
+        str | None: APPROVED, NEEDS REVIEW, REJECTED, or None if there is no clear status
+    """
+    lines = (text or "").splitlines()
+    for number, line in enumerate(lines):
+        heading = _STATUS_HEADING.search(line)
+        if not heading:
+            continue
+        rest = line[heading.end():]
+        if not _STATUS.search(rest) and number + 1 < len(lines):
+            rest = lines[number + 1]
+        statuses = {re.sub(r"[\s_-]+", " ", match.upper()) for match in _STATUS.findall(rest)}
+        if len(statuses) == 1:
+            return statuses.pop()
+    return None
+
+
+def crew_verification_status(response):
+    """verification_status() of the verification task in a CrewOutput, or None if it did not run"""
+    for output in response.tasks_output:
+        if output.name == "verification":
+            return verification_status(output.raw)
+    return None
+
+
+def is_rejected(output) -> bool:
+    """Pipeline gate: True for a verification TaskOutput that rejected the document"""
+    return output.name == "verification" and verification_status(output.raw) == REJECTED
+
+
+## Local pre-screen
+@dataclass
+class PrescreenResult:
+    """Outcome of the local heuristics; a passing document still goes to the LLM verifier"""
+    text_chars: int
+    line_items: list = field(default_factory=list)  # "statement.item" rows found in the text
+    terms: list = field(default_factory=list)       # distinct financial terms found
+    reasons: list = field(default_factory=list)     # why the document was rejected
+
+    @property
+    def rejected(self) -> bool:
+        return bool(self.reasons)
+
+    def report(self) -> str:
+        """A verification report for a rejected document, in the verification task's format"""
+        return "\n".join([
+            "1. **Document Type**: Not a financial report (local pre-screen, no LLM review)",
+            f"2. **Completeness Check**: {len(self.line_items)} financial statement rows and "
+            f"{len(self.terms)} distinct financial terms found in {self.text_chars} characters of text",
+            "3. **Data Quality Assessment**: Not assessed",
+            f"4. **Red Flags**: {'; '.join(self.reasons)}",
+            f"5. **Verification Status**: {REJECTED} - {'; '.join(self.reasons)}",
+        ])
+
+
+def prescreen_text(text: str) -> PrescreenResult:
+    """Check extracted document text for signs of a financial report
+
+    Rejects documents with (almost) no extractable text, and documents with
+    neither a recognizable statement row nor a few distinct financial terms.
+    """
+    text = text or ""
+    result = PrescreenResult(text_chars=len(text.strip()))
+    if result.text_chars < PRESCREEN_MIN_CHARS:
+        result.reasons.append(f"only {result.text_chars} characters of extractable text")
+        return result
+    result.line_items = sorted(f"{statement}.{item}" for statement, item in text_line_items(text))
+    result.terms = [match.group(0).lower() for term in _FINANCIAL_TERMS if (match := term.search(text))]
+    if not result.line_items and len(result.terms) < PRESCREEN_MIN_TERMS:
+        result.reasons.append(
+            f"no financial statement rows and only {len(result.terms)} distinct financial terms"
+        )
+    return result
+
+
+def prescreen_document(path: str) -> PrescreenResult:
+    """prescreen_text() for a file path or document reference, reusing the parsed-document cache"""
+    with stage("prescreen") as span:
+        source, digest = resolve_document(path)
+        text = document_cache.get(digest)
+        if text is None:
+            text = extract_text(source)
+            document_cache.put(digest, text)
+        result = prescreen_text(text)
+        span["rejected"] = result.rejected
+    if result.rejected:
+        registry.increment("fda_documents_rejected_total", labels=(("stage", "prescreen"),))
+    return result
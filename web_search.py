@@ -0,0 +1,215 @@
+## Importing libraries and files
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from concurrent.futures import Future
+
+from cache import CACHE_DIR, DiskCache
+from metrics import registry, stage
+from retrieval import ChunkIndex, chunk_pages
+
+## Web search configuration (overridable through environment variables)
+# serper: live Serper API; corpus: local files in SEARCH_CORPUS (no network);
+# auto: serper when SERPER_API_KEY is set, else the corpus if it exists
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_CORPUS = os.getenv("SEARCH_CORPUS", "data/search_corpus")
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Market context goes stale; a day keeps repeated requests for a company off the network
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+SEARCH_CACHE_BYTES = int(os.getenv("SEARCH_CACHE_BYTES", str(64 * 1024 * 1024)))
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "5"))
+
+SEARCH_BACKENDS = ("auto", "serper", "corpus")
+CORPUS_EXTENSIONS = (".txt", ".md")
+
+_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a search query, so trivially different spellings share a cache entry
+
+    Unicode-normalizes, folds case and curly quotes, collapses whitespace and
+    drops surrounding punctuation: "  ACME Corp  outlook? " -> "acme corp outlook".
+    """
+    query = unicodedata.normalize("NFKC", query or "").translate(_QUOTES).lower()
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.strip(" .,;:!?'\"")
+
+
+## Search backends
+class SerperBackend:
+    """Live Google results through the Serper API"""
+    name = "serper"
+    remote = True
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def search(self, query: str) -> str:
+        # crewai_tools takes seconds to import, so Serper is only loaded on the first search
+        with self._lock:
+            if self._client is None:
+                from crewai_tools import SerperDevTool
+                self._client = SerperDevTool(n_results=SEARCH_RESULTS)
+        results = self._client._run(search_query=query)
+        return results if isinstance(results, str) else json.dumps(results, ensure_ascii=False)
+
+
+class CorpusBackend:
+    """Offline stand-in for web search: BM25 over local text and markdown files
+
+    Every file in the corpus directory is one "page"; results are labelled with its
+    name. The index is rebuilt when a file is added, removed or modified.
+    """
+    name = "corpus"
+    remote = False
+
+    def __init__(self, directory: str = SEARCH_CORPUS):
+        self.directory = directory
+        self._index = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _files(self) -> list:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            files.extend(os.path.join(root, name) for name in names if name.lower().endswith(CORPUS_EXTENSIONS))
+        return sorted(files)
+
+    def index(self) -> ChunkIndex:
+        with self._lock:
+            files = self._files()
+            signature = [(path, os.stat(path).st_mtime_ns) for path in files]
+            if self._index is None or signature != self._signature:
+                chunks = []
+                for path in files:
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        name = os.path.relpath(path, self.directory)
+                        chunks.extend((name, text) for _, text in chunk_pages([f.read()]))
+                self._index = ChunkIndex(chunks)
+                self._signature = signature
+            return self._index
+
+    def search(self, query: str) -> str:
+        results = self.index().search(query, top_k=SEARCH_RESULTS)
+        if not results:
+            return f"No results in the local search corpus for: {query}"
+        return "\n\n".join(
+            f"Title: {name}\nSnippet: {text}\n---" for _, name, text in results
+        )
+
+
+class UnavailableBackend:
+    """Used when neither Serper nor a local corpus is configured"""
+    name = "none"
+    remote = False
+
+    def search(self, query: str) -> str:
+        return (
+            "Web search is unavailable (no SERPER_API_KEY and no local search corpus); "
+            "rely on the document and the other tools."
+        )
+
+
+def make_backend(name: str = SEARCH_BACKEND):
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend {name!r}; expected one of {SEARCH_BACKENDS}")
+    if name == "serper" or (name == "auto" and os.getenv("SERPER_API_KEY")):
+        return SerperBackend()
+    if name == "corpus" or os.path.isdir(SEARCH_CORPUS):
+        return CorpusBackend()
+    return UnavailableBackend()
+
+
+## Cached, coalesced search
+class CachedSearch:
+    """Web search with a local result cache shared by every agent, crew and request
+
+    Queries are normalized before lookup. Results from remote backends are kept in
+    an on-disk store with a TTL and LRU eviction by size. Identical searches issued
+    while one is already running wait for its result instead of calling the
+    backend again.
+    """
+
+    def __init__(self, backend=None, store: DiskCache = None):
+        self.backend = backend
+        self.store = store
+        self._in_flight = {}  # cache key -> Future of the running search
+        self._lock = threading.Lock()
+
+    def _get_backend(self):
+        with self._lock:
+            if self.backend is None:
+                self.backend = make_backend()
+            return self.backend
+
+    def _get_store(self):
+        # Opened on first use so importing the tools does not touch the disk
+        with self._lock:
+            if self.store is None and SEARCH_CACHE_ENABLED:
+                self.store = DiskCache(
+                    os.path.join(CACHE_DIR, "search.sqlite"), SEARCH_CACHE_BYTES, ttl=SEARCH_CACHE_TTL
+                )
+            return self.store
+
+    def _cached(self, key: str):
+        store = self._get_store()
+        blob = store.get(key) if store is not None else None
+        return None if blob is None else zlib.decompress(blob).decode("utf-8")
+
+    def search(self, query: str) -> str:
+        backend = self._get_backend()
+        normalized = normalize_query(query)
+        key = hashlib.sha256(f"{backend.name}|{normalized}".encode("utf-8")).hexdigest()
+        with stage("web_search", backend=backend.name) as span:
+            result, span["cache"] = self._search(backend, normalized, key)
+        registry.increment(
+            "fda_search_requests_total", labels=(("backend", backend.name), ("cache", span["cache"]))
+        )
+        return result
+
+    def _search(self, backend, query: str, key: str) -> tuple:
+        """(result, "hit" | "coalesced" | "miss") for a normalized query"""
+        # Local backends are cheap and always current, so only remote results are stored
+        if backend.remote:
+            result = self._cached(key)
+            if result is not None:
+                return result, "hit"
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result(), "coalesced"
+
+        try:
+            # A search that finished between the lookup above and registering this
+            # one has stored its result by now
+            result = self._cached(key) if backend.remote else None
+            outcome = "hit" if result is not None else "miss"
+            if result is None:
+                result = backend.search(query)
+                if backend.remote and self.store is not None:
+                    self.store.put(key, zlib.compress(result.encode("utf-8")))
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return result, outcome
+
+    def stats(self) -> dict:
+        store = self._get_store()
+        return {"backend": self._get_backend().name, "cache": store.stats() if store is not None else None}
+
+
+web_search = CachedSearch()